@@ -0,0 +1,161 @@
+import re
+from typing import Iterable, List, Optional
+
+# lines of page chrome that carry no article content
+BOILERPLATE_PATTERNS = [
+    r"^advertisement$",
+    r"^(sign in|sign up|log in|subscribe)\b",
+    r"^(read more|see more|view comments|related stories|recommended stories|trending)\b",
+    r"^(share|tweet|email|print|copy link)$",
+    r"^(click here|tap here)\b",
+    r"^(terms|privacy|cookie)( policy| and privacy policy| settings)?$",
+    r"^copyright\b|^©",
+    r"^all rights reserved",
+]
+_BOILERPLATE_RE = re.compile("|".join(BOILERPLATE_PATTERNS), re.IGNORECASE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# corporate suffixes dropped from org names before mention matching ("Apple Inc." -> "Apple")
+_ORG_SUFFIX_RE = re.compile(
+    r"[\s,]+(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|llc|holdings|group|sa|ag|nv)\.?$",
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 characters per token (same estimate as AsyncLLMClient)."""
+    return len(text) // 4 + 1
+
+
+def strip_boilerplate(content: str) -> List[str]:
+    """
+    Split article text into paragraphs, dropping page chrome and repeated paragraphs.
+
+    Returns:
+        Paragraphs in article order
+    """
+    paragraphs = []
+    seen = set()
+    for line in content.split("\n"):
+        line = line.strip()
+        if not line or _BOILERPLATE_RE.search(line):
+            continue
+        if line in seen:
+            continue
+        seen.add(line)
+        paragraphs.append(line)
+    return paragraphs
+
+
+def mention_terms(ticker: Optional[str], org: Optional[str]) -> List[str]:
+    """Strings whose presence marks a paragraph as mentioning the company."""
+    terms = []
+    if ticker:
+        terms.append(ticker)
+    if org:
+        name = org.strip()
+        while _ORG_SUFFIX_RE.search(name):
+            name = _ORG_SUFFIX_RE.sub("", name)
+        if name:
+            terms.append(name)
+    return terms
+
+
+class ContentChunker:
+    """
+    Token-budgeted preprocessing of article text before an LLM call.
+
+    Boilerplate lines are removed, the text is split on paragraph boundaries (sentences for
+    oversized paragraphs) and packed into chunks of at most `max_tokens`. For the insight
+    call, paragraphs that mention the company are kept first, with the lead paragraph for
+    context, so a long article is cut down to the part that matters instead of its first
+    8000 characters. If nothing mentions the company the leading chunk is sent, as before.
+    """
+    def __init__(self, max_tokens: int = 2000, filter_mentions: bool = True, lead_paragraphs: int = 1):
+        self.max_tokens = max_tokens
+        self.filter_mentions = filter_mentions
+        self.lead_paragraphs = lead_paragraphs
+
+    def _split_long(self, paragraph: str) -> List[str]:
+        """Break a paragraph over the budget into sentence groups (hard cut as a last resort)."""
+        if estimate_tokens(paragraph) <= self.max_tokens:
+            return [paragraph]
+        pieces = []
+        current = ""
+        for sentence in _SENTENCE_RE.split(paragraph):
+            while estimate_tokens(sentence) > self.max_tokens:
+                cut = self.max_tokens * 4
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:]
+            candidate = f"{current} {sentence}".strip()
+            if current and estimate_tokens(candidate) > self.max_tokens:
+                pieces.append(current)
+                current = sentence
+            else:
+                current = candidate
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def paragraphs(self, content: str) -> List[str]:
+        """Clean paragraphs, none of them over the token budget."""
+        return [piece for paragraph in strip_boilerplate(content) for piece in self._split_long(paragraph)]
+
+    def chunk(self, content: str) -> List[str]:
+        """
+        Pack the article into chunks on paragraph boundaries.
+
+        Returns:
+            Chunks of at most max_tokens each, in article order
+        """
+        chunks = []
+        current: List[str] = []
+        size = 0
+        for paragraph in self.paragraphs(content):
+            tokens = estimate_tokens(paragraph)
+            if current and size + tokens > self.max_tokens:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(paragraph)
+            size += tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    def prepare(self, content: str) -> str:
+        """Leading chunk of the cleaned article (e.g. for summaries)."""
+        chunks = self.chunk(content)
+        return chunks[0] if chunks else ""
+
+    def prepare_for(self, content: str, terms: Iterable[str]) -> str:
+        """
+        Cleaned article cut to the budget, keeping paragraphs that mention any of `terms`.
+
+        Args:
+            content: Article text
+            terms: Tickers / org names (see mention_terms)
+
+        Returns:
+            Lead paragraph(s) plus mentioning paragraphs in article order, within max_tokens
+        """
+        if not self.filter_mentions:
+            return self.prepare(content)
+
+        paragraphs = self.paragraphs(content)
+        # case-sensitive whole-word match, so short tickers don't hit ordinary words
+        patterns = [re.compile(rf"(?<!\w){re.escape(term)}(?!\w)") for term in terms if term]
+        mentions = [i for i, paragraph in enumerate(paragraphs)
+                    if any(pattern.search(paragraph) for pattern in patterns)]
+        if not mentions:
+            return self.prepare(content)
+
+        selected = []
+        size = 0
+        for i in list(range(min(self.lead_paragraphs, len(paragraphs)))) + mentions:
+            if i in selected:
+                continue
+            tokens = estimate_tokens(paragraphs[i])
+            if size + tokens > self.max_tokens:
+                break
+            selected.append(i)
+            size += tokens
+        return "\n".join(paragraphs[i] for i in sorted(selected))
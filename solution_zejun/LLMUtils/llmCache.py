@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class LLMResponseCache:
+    """
+    Persistent, content-addressed cache of LLM responses.
+
+    The key is a hash of the whole request payload - model, system prompt (the prompt file
+    contents), user message and response format - so editing a prompt file invalidates its
+    old entries on its own. Entries expire after `ttl_seconds`; beyond `max_entries` the least
+    recently used ones are evicted. SQLite (WAL) lets every service share one cache file.
+    """
+    def __init__(self, path: str, ttl_seconds: int = 30 * 24 * 3600, max_entries: int = 50000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+
+    @staticmethod
+    def key_for(payload: Dict) -> str:
+        """Hash of the full request payload."""
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, payload: Dict) -> Optional[Dict]:
+        """Cached response for a payload, or None on a miss or an expired entry."""
+        key = self.key_for(payload)
+        now = time.time()
+        with self._lock, self.conn:
+            row = self.conn.execute("SELECT response, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, payload: Dict, response: Dict):
+        """Store a response and evict the least recently used entries beyond max_entries."""
+        key = self.key_for(payload)
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response), now, now)
+            )
+            size = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            if size > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM llm_cache WHERE key IN "
+                    "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                    (size - self.max_entries,)
+                )
+
+    def evict(self, payload: Dict):
+        """Drop the cached response of a payload (e.g. one its caller could not parse)."""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (self.key_for(payload),))
+
+    def purge_expired(self) -> int:
+        """Delete every expired entry. Returns the number of entries removed."""
+        with self._lock, self.conn:
+            cursor = self.conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters of this process and the current cache size."""
+        with self._lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size}
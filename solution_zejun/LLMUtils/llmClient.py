@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import aiohttp
+
+from LLMUtils.llmCache import LLMResponseCache
+
+
+class RateLimiter:
+    """Sliding one-minute window over requests and (estimated) tokens."""
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._window = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._lock = asyncio.Lock()
+
+    def _purge(self, now: float):
+        while self._window and now - self._window[0][0] >= 60:
+            _, tokens = self._window.popleft()
+            self._tokens_in_window -= tokens
+
+    async def acquire(self, tokens: int):
+        """Wait until one more request of `tokens` tokens fits in the last minute."""
+        # a single request larger than the budget is let through on an empty window
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._purge(now)
+                if (len(self._window) < self.requests_per_minute
+                        and self._tokens_in_window + tokens <= self.tokens_per_minute):
+                    self._window.append((now, tokens))
+                    self._tokens_in_window += tokens
+                    return
+                await asyncio.sleep(60 - (now - self._window[0][0]))
+
+
+class AsyncLLMClient:
+    """
+    Shared async client for the chat completions API.
+
+    One keep-alive HTTP session, at most `max_concurrency` requests in flight, and request- and
+    token-per-minute limits. `api_url` can point to a local mock server for testing.
+    With a `cache`, identical requests are answered from it without calling the API; a response is
+    cached only once the caller's `parse` accepted it.
+    """
+    def __init__(self,
+                 headers: Dict[str, str],
+                 api_url: str = "https://api.openai.com/v1/chat/completions",
+                 max_concurrency: int = 4,
+                 requests_per_minute: int = 60,
+                 tokens_per_minute: int = 200000,
+                 max_retries: int = 2,
+                 cache: Optional[LLMResponseCache] = None):
+        self.headers = headers
+        self.api_url = api_url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.cache = cache
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @staticmethod
+    def estimate_tokens(payload: Dict) -> int:
+        """Rough prompt size: ~4 characters per token."""
+        chars = sum(len(str(message.get("content", ""))) for message in payload.get("messages", []))
+        return chars // 4 + 1
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(headers=self.headers, connector=connector)
+        return self._session
+
+    async def chat(self, payload: Dict, timeout: float = 60, parse: Optional[Callable[[Dict], Any]] = None) -> Any:
+        """
+        Send one chat completion request.
+
+        Args:
+            payload: Request body (model, messages, ...)
+            timeout: Total timeout per attempt in seconds
+            parse: Turns the response into the caller's result, raising if it is malformed; only
+                responses it accepts are cached, so a malformed answer is asked for again next time
+
+        Returns:
+            Parsed JSON response, or parse(response)
+
+        Raises:
+            RuntimeError: On a non-200 response after retries
+            asyncio.TimeoutError: If the request timed out
+            Exception: Whatever parse raises for a malformed response
+        """
+        if parse is None:
+            parse = lambda response: response
+        if self.cache is not None:
+            cached = self.cache.get(payload)
+            if cached is not None:
+                try:
+                    return parse(cached)
+                except Exception:
+                    # cached before it was validated - ask again
+                    self.cache.evict(payload)
+
+        result = await self._post(payload, timeout)
+        parsed = parse(result)
+        if self.cache is not None:
+            self.cache.put(payload, result)
+        return parsed
+
+    async def _post(self, payload: Dict, timeout: float) -> Dict:
+        """POST one request within the rate limits, retrying rate limiting and server errors."""
+        tokens = self.estimate_tokens(payload)
+        for attempt in range(self.max_retries + 1):
+            # every attempt is a request the API counts against the limits
+            await self.rate_limiter.acquire(tokens)
+            async with self._slots:
+                async with self._get_session().post(
+                    self.api_url, json=payload, timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    status, text = response.status, await response.text()
+            # back off and retry on rate limiting and server errors - without holding a slot,
+            # so a burst of 429s does not stall the other requests
+            if status in (429, 500, 502, 503) and attempt < self.max_retries:
+                await asyncio.sleep(2 ** attempt)
+                continue
+            raise RuntimeError(f"API call failed: {status} {text}")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -1,17 +1,29 @@
 import os
-import requests
+import asyncio
 from dotenv import load_dotenv
-from typing import Dict, Optional, List
-from bs4 import BeautifulSoup
-import time
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime as dt
 import json
 
 import redis_q.redisUtils as rq
 import dbutils.db_classes as dbs
+import config.conf as configure
+from LLMUtils.llmClient import AsyncLLMClient
+from LLMUtils.llmCache import LLMResponseCache
+from LLMUtils.contentChunker import ContentChunker, mention_terms
+import webUtils.htmlExtract as html_extract
+from webUtils.htmlStore import HtmlBlobStore, default_html_store, read_html
+
+
+def default_llm_client(headers: Dict[str, str]) -> AsyncLLMClient:
+    """LLM client from config: rate limits from llm_settings, response cache from llm_cache."""
+    cache = LLMResponseCache(**configure.llm_cache) if configure.llm_cache else None
+    return AsyncLLMClient(headers, cache=cache, **configure.llm_settings)
+
 
 class FinancialNewsSummarizor:
-    def __init__(self, system_prompt_path: str, news_db_path: str, env_path: str):
+    def __init__(self, system_prompt_path: str, news_db_path: str, env_path: str,
+                 llm_client: Optional[AsyncLLMClient] = None, html_store: Optional[HtmlBlobStore] = None):
         self.system_prompt_path = system_prompt_path
         self.news_db_path = news_db_path
         self.env_path = env_path
@@ -21,6 +33,12 @@ class FinancialNewsSummarizor:
         self.headers = self._set_headers()
         self.news_db = dbs.NewsManager(news_db_path)
         self.job_status = rq.JobRegisterMg()
+        # shared keep-alive client with concurrency and rate limits
+        self.llm_client = llm_client or default_llm_client(self.headers)
+        # article text is cleaned and cut to a token budget before the call
+        self.chunker = ContentChunker(configure.content_budget["summary_tokens"], filter_mentions=False)
+        # reads the blob references the crawler records as file_path
+        self.html_store = html_store or default_html_store()
         
     
     def _get_prompt(self) -> str:
@@ -45,37 +63,25 @@ class FinancialNewsSummarizor:
             "Authorization": f"Bearer {api_key}"
         }
  
-    def extract_news_content(self, url: str):
-        record = self.news_db.get_record_by_url(url)
-        
-        if not record or record.get('file_path') in [None, "", "pending"]:
+    def extract_news_content(self, url: str, record: Optional[Dict] = None):
+        if record is None:
+            record = self.news_db.get_record_by_url(url)
+        if not record:
             return None
         
-        with open(record.get('file_path'), 'r', encoding='utf-8') as f:
-            html_content = f.read()
-
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        main = soup.find("main")
-        if not main:
+        # text extracted by the crawler - no file to read or parse
+        if record.get('content') not in [None, "", "pending"]:
+            return record['content']
+        
+        if record.get('file_path') in [None, "", "pending"]:
             return None
         
-        # Get text content inside <main>, excluding scripts/styles
-        for tag in main(["script", "style"]):
-            tag.decompose()
+        html_content = read_html(record.get('file_path'), self.html_store)
 
-        content = main.get_text(separator="\n", strip=True)
-        lines = content.split("Story continues")[0].split("\n")
-        new_content = ""
-        for line in lines:
-            if line.startswith(")") | (len(line) < 10) :
-                new_content += " " + line
-            else:
-                new_content += "\n" + line
-
-        return new_content
+        # only <main> is walked, with the fastest installed parser (see webUtils/htmlExtract.py)
+        return html_extract.extract_main_text(html_content)
        
-    def get_summary(self, content: str) -> Dict[str, str]:
+    async def get_summary(self, content: str) -> Dict[str, str]:
         """
         Get summary and publication date from LLM API.
         
@@ -89,7 +95,7 @@ class FinancialNewsSummarizor:
         # Prepare user message
         user_msg = f"""
         
-        Content: {content}
+        Content: {self.chunker.prepare(content)}
         
         Please provide a summary and infer the publication date.
         """
@@ -105,16 +111,7 @@ class FinancialNewsSummarizor:
             #"temperature": 0.1  # Low temperature for more deterministic results
         }
         
-        api_url = "https://api.openai.com/v1/chat/completions"
-        
-        try:
-            response = requests.post(api_url, headers=self.headers, json=payload, timeout=40)
-            # print(f"API ---: {response.status_code} {response.text}")
-            if response.status_code != 200:
-                raise RuntimeError(f"API call failed: {response.status_code} {response.text}")
-            
-            # Parse response
-            result = response.json()
+        def parse(result: Dict) -> Dict[str, str]:
             # print(f" >> result {result}")
             llm_output = result['choices'][0]['message']['content']
             
@@ -127,8 +124,12 @@ class FinancialNewsSummarizor:
                 "summary": summary,
                 "publish_date": publish_date if publish_date else ""
             }
+        
+        try:
+            # the response is cached only if it parses
+            return await self.llm_client.chat(payload, timeout=40, parse=parse)
             
-        except requests.exceptions.Timeout:
+        except asyncio.TimeoutError:
             raise RuntimeError("API request timed out")
         except Exception as e:
             raise RuntimeError(f"Error calling LLM API: {e}")
@@ -154,27 +155,44 @@ class FinancialNewsSummarizor:
                 return date_str
         return ""
     
-    def process_news_article(self, url: str) -> Dict[str, str]:
+    async def summarise_article(self, url: str, record: Optional[Dict] = None) -> Tuple[Dict[str, str], Optional[Dict[str, str]]]:
+        """
+        Extract and summarise an article without writing to the database.
+        
+        Args:
+            url: News article URL
+            record: News record of the URL if already fetched (optional)
+            
+        Returns:
+            Tuple of (llm_result or error dict, news record updates or None on error)
+        """
         print(f"Processing article: {url}")
         
         # Get content
-        content = self.extract_news_content(url)
+        content = self.extract_news_content(url, record)
         if not content:
-            return {"error": "Content not available"}
+            return {"error": "Content not available"}, None
         print(f"content length: {len(content)}")
         
         # Get summary from LLM
         try:
-            llm_result = self.get_summary(content)
+            llm_result = await self.get_summary(content)
         except Exception as e:
-            return {"error": f"LLM processing failed: {e}"}
+            return {"error": f"LLM processing failed: {e}"}, None
         print(f"llm_result: {len(llm_result)}")
-        # Update database
         updates = {
             "content": content,
             "summary": llm_result["summary"],
             "publish_date": llm_result["publish_date"]
         }
+        return llm_result, updates
+    
+    async def process_news_article(self, url: str) -> Dict[str, str]:
+        llm_result, updates = await self.summarise_article(url)
+        if updates is None:
+            return llm_result
+        
+        # Update database
         update_success = self.news_db.update_fields(
             url, **updates
         )
@@ -185,23 +203,34 @@ class FinancialNewsSummarizor:
         print("summary - done")
         return llm_result
     
-    def batch_process_news_article(self, urls, job_id):
+    async def batch_process_news_article(self, urls, job_id):
         url_record = self.news_db.fetch_records(urls)
         urls_to_sumarize = []
         for url in url_record:
             if url_record[url] is None:
                 print(f"{url} - None")
                 continue
-            if url_record[url]["content"] == "pending":
+            # content may already be set by the crawler, the summary is what is pending
+            if url_record[url]["summary"] == "pending":
                 urls_to_sumarize.append(url)
                 
-        for url in urls_to_sumarize:
-            print(f"processing url {url}")
-            self.process_news_article(url)
-            time.sleep(1)
+        # summarise in parallel - the LLM client bounds concurrency and request rate
+        print(f"processing urls {urls_to_sumarize}")
+        results = await asyncio.gather(*[self.summarise_article(url, url_record[url]) for url in urls_to_sumarize])
+        
+        updates = {}
+        for url, (llm_result, article_updates) in zip(urls_to_sumarize, results):
+            if article_updates is None:
+                print(f"{url} - {llm_result['error']}")
+                continue
+            updates[url] = article_updates
+        
+        # record the whole job in one write
+        self.news_db.update_many(updates)
 
         status = "sumaries ready"
-        self.job_status.push_status(job_id, status)
+        for job in rq.as_job_ids(job_id):
+            self.job_status.push_status(job, status)
         return True, urls
         
         
@@ -212,7 +241,8 @@ class NewsInsights:
                  news_db_path: str, 
                  fragment_db_path: str, 
                  system_prompt_path: str,
-                 env_path: str
+                 env_path: str,
+                 llm_client: Optional[AsyncLLMClient] = None
                 ):
         """
         Initialize News Insights processor.
@@ -231,6 +261,11 @@ class NewsInsights:
         self.sys_prompt = self._load_system_prompt()
         self.api_key = self._load_api_key()
         self.headers = self._set_headers()
+        # shared keep-alive client with concurrency and rate limits
+        self.llm_client = llm_client or default_llm_client(self.headers)
+        # keeps the paragraphs that mention the company, within the token budget
+        self.chunker = ContentChunker(configure.content_budget["insight_tokens"],
+                                      filter_mentions=configure.content_budget["filter_mentions"])
     
     def _load_system_prompt(self) -> str:
         """Load system prompt from file."""
@@ -266,70 +301,85 @@ class NewsInsights:
         Returns:
             List of URLs that need processing
         """
-        new_urls = []
-        for url in urls:
-            print("-----", url, ticker)
-            if not self.fragment_db.check_fragments(url, ticker):
-                new_urls.append(url)
+        new_urls = self.fragment_db.missing_fragments(urls, ticker)
         
         print(f"Found {len(new_urls)} new URLs to process out of {len(urls)}")
         return new_urls
     
-    def crop_insights(self, org: Optional[str], ticker: str, urls: List[str], job_id: str) -> bool:
+    @staticmethod
+    def _build_fragment(org: Optional[str], ticker: str, url: str, title: str, llm_result: Optional[Dict]) -> Optional[Dict]:
+        """Fragment record from an LLM insight, None if there is no relation."""
+        if not llm_result or llm_result.get('related_reason_simple') == 'no relation':
+            return None
+        return {
+            "org": org or "",
+            "ticker": ticker,
+            "url": url,
+            "time_created": dt.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            "related_reason_simple": llm_result.get('related_reason_simple', ''),
+            "related_reason_short": llm_result.get('related_reason_short', ''),
+            "polarity": llm_result.get('polarity', 'neutral'),
+            "title": title,
+            "actual_trend": llm_result.get('actual_trend', 'unknown'),
+            "quote_frag": llm_result.get('quote_frag', '')
+        }
+    
+    async def _crop_url(self, companies: List[Tuple[str, Optional[str]]], url: str, news_record: Optional[Dict]) -> List[Dict]:
+        """
+        Extract the fragments of one article for one or more (ticker, org) companies.
+        Several companies are sent in a single LLM call, so the article is read by the model once.
+        """
+        try:
+            if not news_record:
+                print(f"Skipping {url} - no news record found")
+                return []
+            
+            # Get content and publication date
+            content = news_record.get('content', '')
+            publish_date = news_record.get('publish_date', '')
+            title = news_record.get('title', '')
+            
+            if not content or content == 'pending':
+                print(f"Skipping {url} - no content available")
+                return []
+            
+            # Call LLM for insight extraction
+            if len(companies) == 1:
+                ticker, org = companies[0]
+                llm_results = {ticker: await self._call_llm_insight(org, ticker, content, publish_date, title)}
+            else:
+                llm_results = await self._call_llm_insight_multi(companies, content, publish_date, title) or {}
+            
+            fragments = []
+            for ticker, org in companies:
+                fragment = self._build_fragment(org, ticker, url, title, llm_results.get(ticker))
+                if fragment is not None:
+                    fragments.append(fragment)
+            return fragments
+            
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            return []
+    
+    async def crop_insights(self, org: Optional[str], ticker: str, urls: List[str], job_id: str) -> bool:
         """
         Extract insights from news content for a specific company.
         """
         print(f"Starting insight extraction for {ticker} ({org}) with {len(urls)} URLs")
         
-        processed_count = 0
-        for url in urls:
-            try:
-                # Get news record
-                news_record = self.news_db.get_record_by_url(url)
-                if not news_record:
-                    print(f"Skipping {url} - no news record found")
-                    continue
-                
-                # Get content and publication date
-                content = news_record.get('content', '')
-                publish_date = news_record.get('publish_date', '')
-                title = news_record.get('title', '')
-                
-                if not content or content == 'pending':
-                    print(f"Skipping {url} - no content available")
-                    continue
-                
-                # Call LLM for insight extraction
-                llm_result = self._call_llm_insight(org, ticker, content, publish_date, title)
-                # print(f" >> 2 result -- {llm_result}")
-                
-                if llm_result and llm_result.get('related_reason_simple') != 'no relation':
-                    # Save fragment
-                    fragment_data = {
-                        "org": org or "",
-                        "ticker": ticker,
-                        "url": url,
-                        "time_created": dt.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-                        "related_reason_simple": llm_result.get('related_reason_simple', ''),
-                        "related_reason_short": llm_result.get('related_reason_short', ''),
-                        "polarity": llm_result.get('polarity', 'neutral'),
-                        "title": title,
-                        "actual_trend": llm_result.get('actual_trend', 'unknown'),
-                        "quote_frag": llm_result.get('quote_frag', '')
-                    }
-                    self.save_fragment(fragment_data)
-                    processed_count += 1
-                
-            except Exception as e:
-                print(f"Error processing {url}: {e}")
-                continue
+        # one read for every news record, then the LLM calls in parallel, each article's
+        # fragments saved and published as soon as its call returns
+        news_records = self.news_db.fetch_records(urls)
+        results = await asyncio.gather(*[self._crop_and_publish([(ticker, org)], url, news_records.get(url), {ticker: [job_id]})
+                                         for url in urls])
+        processed_count = sum(len(url_fragments) for url_fragments in results)
         
-        # Update job status
-        self.job_db.push_status(job_id, f"news crops ready")
+        # Update job status - "news crops ready" once all the job's articles are done
+        self.job_db.finish_articles(job_id, urls)
         print(f"Completed insight extraction for {ticker}. Processed: {processed_count}/{len(urls)}")
         return True
     
-    def _call_llm_insight(self, org: Optional[str], ticker: str, content: str, publish_date: str, title: str):
+    async def _call_llm_insight(self, org: Optional[str], ticker: str, content: str, publish_date: str, title: str):
         """
         Call LLM API for insight extraction.
         """
@@ -340,7 +390,7 @@ class NewsInsights:
         Publication Date: {publish_date or 'Not specified'}
         
         News Content:
-        {content[:8000]}  # Truncate very long content
+        {self.chunker.prepare_for(content, mention_terms(ticker, org))}
         """
         
         messages = [
@@ -354,19 +404,67 @@ class NewsInsights:
             "response_format": { "type": "json_object" }
         }
         
-        api_url = "https://api.openai.com/v1/chat/completions"
-        
-        try:
-            response = requests.post(api_url, headers=self.headers, json=payload, timeout=60)
-            
-            if response.status_code != 200:
-                raise RuntimeError(f"API call failed: {response.status_code} {response.text}")
-            
-            result = response.json()
+        def parse(result: Dict) -> Dict:
             llm_output = result['choices'][0]['message']['content']
             # print(f" >> 1- result -- {result}")
             # Parse JSON response
-            return json.loads(llm_output)
+            insight = json.loads(llm_output)
+            if not isinstance(insight, dict):
+                raise ValueError(f"insight is not a JSON object: {llm_output[:200]}")
+            return insight
+        
+        try:
+            # the response is cached only if it parses
+            return await self.llm_client.chat(payload, timeout=60, parse=parse)
+            
+        except Exception as e:
+            print(f"LLM API error: {e}")
+            return None
+    
+    async def _call_llm_insight_multi(self, companies: List[Tuple[str, Optional[str]]], content: str, publish_date: str, title: str):
+        """
+        Call LLM API once for several companies referenced by the same article.
+        
+        Returns:
+            Dictionary with tickers as keys and single-company insights as values, None on error
+        """
+        terms = [term for ticker, org in companies for term in mention_terms(ticker, org)]
+        company_lines = "\n".join(f"        - Ticker: {ticker}, Company: {org or 'Not specified'}" for ticker, org in companies)
+        user_msg = f"""
+        Companies:
+{company_lines}
+        Article Title: {title}
+        Publication Date: {publish_date or 'Not specified'}
+        
+        News Content:
+        {self.chunker.prepare_for(content, terms)}
+        
+        Answer for every company above in one JSON object keyed by ticker,
+        each value in the single-company JSON format.
+        """
+        
+        messages = [
+            {"role": "system", "content": self.sys_prompt},
+            {"role": "user", "content": user_msg}
+        ]
+        
+        payload = {
+            "model": "gpt-5",
+            "messages": messages,
+            "response_format": { "type": "json_object" }
+        }
+        
+        tickers = set(ticker for ticker, _ in companies)
+        
+        def parse(result: Dict) -> Dict[str, Dict]:
+            llm_output = json.loads(result['choices'][0]['message']['content'])
+            if not isinstance(llm_output, dict):
+                raise ValueError("insights are not a JSON object keyed by ticker")
+            return {ticker: insight for ticker, insight in llm_output.items() if ticker in tickers and isinstance(insight, dict)}
+        
+        try:
+            # the response is cached only if it parses
+            return await self.llm_client.chat(payload, timeout=90, parse=parse)
             
         except Exception as e:
             print(f"LLM API error: {e}")
@@ -378,26 +476,83 @@ class NewsInsights:
         """
         return self.fragment_db.insert_record(fragment_data)
     
-    def process_job(self, job_id: str, org: Optional[str], ticker: str, urls: List[str]) -> bool:
+    def publish_fragments(self, fragments: List[Dict], jobs_by_ticker: Dict[str, List[str]]):
+        """Publish saved fragments to the waiting jobs of their tickers."""
+        fragments_by_ticker = dict()
+        for fragment in fragments:
+            fragments_by_ticker.setdefault(fragment["ticker"], []).append(fragment)
+        for ticker, ticker_fragments in fragments_by_ticker.items():
+            for job_id in jobs_by_ticker.get(ticker, []):
+                self.job_db.publish_fragments(job_id, ticker_fragments)
+    
+    async def _crop_and_publish(self, companies: List[Tuple[str, Optional[str]]], url: str,
+                                news_record: Optional[Dict], jobs_by_ticker: Dict[str, List[str]]) -> List[Dict]:
+        """Crop one article, then save and publish its fragments at once - the app shows them before the job completes."""
+        fragments = await self._crop_url(companies, url, news_record)
+        if fragments:
+            self.save_fragments(fragments)
+            self.publish_fragments(fragments, jobs_by_ticker)
+        return fragments
+    
+    def save_fragments(self, fragments: List[Dict]) -> List[int]:
         """
-        Complete processing pipeline for a job.
+        Save a batch of extracted fragments to database in one write.
+        """
+        return self.fragment_db.insert_records(fragments)
+    
+    async def process_jobs(self, jobs: List[Tuple[List[str], List[str], str, Optional[str]]]) -> Dict[str, bool]:
+        """
+        Process a batch of cropping jobs, calling the LLM once per article for every pending
+        ticker/org that references it (e.g. a sector roundup linked from several tickers).
+        A job's articles may arrive over several messages; each marks its articles as done
+        and the job's last article pushes "news crops ready" (JobRegisterMg.finish_articles).
+        
+        Args:
+            jobs: List of (job_ids, urls, ticker, org) - a message shared by the jobs waiting for
+                the same articles, or (job_id, urls, ticker, org)
+            
+        Returns:
+            Dictionary with job_id as key and success as value
         """
+        jobs = [(rq.as_job_ids(job_ids), urls, ticker, org) for job_ids, urls, ticker, org in jobs]
+        job_ids = list(dict.fromkeys(job_id for ids, _, _, _ in jobs for job_id in ids))
         try:
-            print(job_id, "starting news insight extraction")
+            print(job_ids, "starting batched news insight extraction")
             
-            # Check for existing fragments
-            new_urls = self.check_exist_relations(urls, ticker)
+            # url -> (ticker, org) pairs without a fragment yet
+            pending = dict()
+            jobs_by_ticker = dict()
+            for ids, urls, ticker, org in jobs:
+                for job_id in ids:
+                    if job_id not in jobs_by_ticker.setdefault(ticker, []):
+                        jobs_by_ticker[ticker].append(job_id)
+                for url in self.check_exist_relations(urls, ticker):
+                    companies = pending.setdefault(url, [])
+                    if ticker not in [t for t, _ in companies]:
+                        companies.append((ticker, org))
             
-            if not new_urls:
-                self.job_db.push_status(job_id, "news crops ready")
-                return True
+            if pending:
+                news_records = self.news_db.fetch_records(list(pending.keys()))
+                # each article's fragments are saved and published as soon as its LLM call returns
+                results = await asyncio.gather(*[self._crop_and_publish(companies, url, news_records.get(url), jobs_by_ticker)
+                                                 for url, companies in pending.items()])
+                fragments = [fragment for url_fragments in results for fragment in url_fragments]
+                print(f"Completed insight extraction for {len(pending)} URLs. Fragments: {len(fragments)}")
             
-            # Process insights
-            success = self.crop_insights(org, ticker, new_urls, job_id)
-            self.job_db.push_status(job_id, "news crops ready")
-            return success
+            for ids, urls, _, _ in jobs:
+                for job_id in ids:
+                    self.job_db.finish_articles(job_id, urls)
+            return {job_id: True for job_id in job_ids}
             
         except Exception as e:
             error_msg = f"Job failed: {e}"
-            self.job_db.push_status(job_id, error_msg)
-            raise RuntimeError(error_msg)
\ No newline at end of file
+            for job_id in job_ids:
+                self.job_db.push_status(job_id, error_msg)
+            raise RuntimeError(error_msg)
+    
+    async def process_job(self, job_id: str, org: Optional[str], ticker: str, urls: List[str]) -> bool:
+        """
+        Complete processing pipeline for a job.
+        """
+        results = await self.process_jobs([(job_id, urls, ticker, org)])
+        return results[job_id]
\ No newline at end of file
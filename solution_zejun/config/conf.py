@@ -9,4 +9,100 @@ paths = {"chart_db": f"{project_path}data/tinyDB/chat_db.json",
          "env_path": f"{project_path}env/env.txt",
         }
          
-    
\ No newline at end of file
+    
+# storage engine for ChartDB / NewsManager / NewsCropDatabase: "tinydb" or "sqlite"
+# the sqlite engine keeps each DB next to its json path, e.g. news_db.json -> news_db.sqlite
+# (import existing json DBs with: python -m dbutils.migrate_to_sqlite)
+db_engine = "tinydb"
+
+# LLM client used by the summariser / cropper services (api_url can point to a local mock server)
+llm_settings = {"api_url": "https://api.openai.com/v1/chat/completions",
+                "max_concurrency": 4,
+                "requests_per_minute": 60,
+                "tokens_per_minute": 200000,
+               }
+
+# persistent LLM response cache shared by the services (set to None to disable)
+llm_cache = {"path": f"{project_path}data/llm_cache/llm_cache.sqlite",
+             "ttl_seconds": 30 * 24 * 3600,
+             "max_entries": 50000,
+            }
+
+# token budgets for article text sent to the LLM (see LLMUtils/contentChunker.py)
+# filter_mentions keeps the paragraphs naming the ticker / org for the insight call
+content_budget = {"summary_tokens": 3000,
+                  "insight_tokens": 2000,
+                  "filter_mentions": True,
+                 }
+
+# service 1: extract article text at crawl time into the news record, so the summariser
+# reads no html files; with keep_raw_html False only pages without extracted text are written
+crawl_settings = {"extract_content": True,
+                  "keep_raw_html": True,
+                 }
+
+# raw pages are kept once per distinct page as compressed, content-addressed blobs
+# (codec "zstd" needs the zstandard package, else "gzip"); None writes plain html files to raw_html_dir
+# (move existing files into the store with: python -m dbutils.migrate_html_store)
+html_store = {"root": f"{project_path}data/raw_blobs/",
+              "codec": "zstd",
+              "level": 3,
+             }
+
+# retention, run next to the workers with: python -m dbutils.retention [--loop]
+# ChartDB keeps the latest chart_keep_latest snapshots per ticker (none older than chart_max_age_days
+# behind the latest); raw pages no news record references are deleted after orphan_grace_hours;
+# raw_html_max_age_days also deletes the pages of summarised articles older than that (None keeps them)
+retention = {"chart_keep_latest": 3,
+             "chart_max_age_days": 30,
+             "raw_html_max_age_days": None,
+             "orphan_grace_hours": 6,
+             "batch_size": 200,
+             "pause_seconds": 0.05,
+             "interval_seconds": 3600,
+            }
+
+# chart snapshot freshness: ttl per ticker, else per market (ticker suffix after ".", "" for none),
+# else default. A snapshot expired by less than stale_seconds is served at once while a background
+# refresh is queued (stale-while-revalidate); stale_seconds None re-crawls on expiry, as before
+chart_freshness = {"default_ttl_seconds": 24 * 3600,
+                   "market_ttl_seconds": {"": 24 * 3600, "SI": 24 * 3600, "HK": 24 * 3600},
+                   "ticker_ttl_seconds": {},
+                   "stale_seconds": 6 * 24 * 3600,
+                   "refresh_lock_seconds": 900,
+                  }
+
+# proactive refresh of hot tickers (python -m redis_q.refreshScheduler): the top_k most queried
+# tickers of the last lookback_days are re-crawled lead_seconds ahead of their chart expiry, at most
+# max_refreshes_per_hour, and only inside off_peak_hours ([start, end) UTC hours; None = any time)
+refresh_scheduler = {"top_k": 20,
+                     "lookback_days": 7,
+                     "lead_seconds": 2 * 3600,
+                     "max_refreshes_per_hour": 30,
+                     "off_peak_hours": [[18, 24], [0, 6]],
+                     "interval_seconds": 600,
+                    }
+
+# job queues between app and services: "list" (RPUSH / BLPOP, a popped job is gone) or "stream"
+# (Redis Streams consumer group, redis >= 6.2: a job stays pending until the worker acks it, is claimed
+# by another replica after claim_idle_seconds, and moves to "<queue>:dead" after max_deliveries)
+job_queue = {"backend": "stream",
+             "group": "workers",
+             "claim_idle_seconds": 900,
+             "max_deliveries": 5,
+            }
+
+# job registry (redis_q/redisUtils.py JobRegisterMg): a job's status keys expire job_ttl_seconds after
+# its last status; python -m redis_q.jobCompactor [--loop] prunes older registry entries every
+# interval_seconds, batch_size keys at a time with pause_seconds in between
+job_registry = {"job_ttl_seconds": 7 * 24 * 3600,
+                "batch_size": 500,
+                "pause_seconds": 0.01,
+                "interval_seconds": 3600,
+               }
+
+# streamlit app: seconds the insight panel waits for a job's completion notification, and how many
+# stored insights of the ticker it shows at query time (new ones are added as the cropper publishes them)
+insight_panel = {"wait_seconds": 600,
+                 "cached_fragments": 20,
+                }
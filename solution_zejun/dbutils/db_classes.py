@@ -1,24 +1,36 @@
-from tinydb import TinyDB, Query
 from datetime import datetime as dt, timedelta
-import os
+import calendar
 from typing import List, Tuple, Optional, Dict, Any
 import time
 
+import config.conf as configure
+import dbutils.storage_backends as sb
+
 
 class ChartDB:
-    def __init__(self, json_file_path: str):
+    # storage layout, shared by every engine (see dbutils/storage_backends.py)
+    storage_spec = {
+        "table": "chart",
+        "order_field": "time_created",
+        # ticker -> latest snapshot, the lookup behind check_latest
+        "key_indexes": {"latest_index": ("ticker",)},
+        "ordered_indexes": {"ticker_index": "ticker"},
+    }
+    
+    def __init__(self, json_file_path: str, engine: Optional[str] = None):
         self.json_file_path = json_file_path
+        self.engine = engine or configure.db_engine
         self.db = None
         self._initialize_db()
     
     def _initialize_db(self):
         """Check if DB exists, create with example record if not."""
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.json_file_path), exist_ok=True)
-        # Initialize database
-        self.db = TinyDB(self.json_file_path)
+        # Initialize database (the backend creates the directory if it doesn't exist)
+        if self.db is not None:
+            self.db.close()
+        self.db = sb.open_backend(self.engine, self.json_file_path, **self.storage_spec)
         # Check if database is empty and add example record
-        if not self.db.all():
+        if self.db.is_empty():
             example_record = {
                 "ticker": "mock_ticker",
                 "org": "zzj_org",
@@ -39,53 +51,91 @@ class ChartDB:
         Returns:
             Document ID of the inserted record
         """
+        now = time.time()
         record = {
             "ticker": ticker,
             "org": org,
-            "time_created": dt.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            "time_created": dt.utcfromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S"),
+            # epoch seconds, so freshness checks need no date parsing
+            "time_created_ts": now,
             "url_keys": url_keys
         }
         doc_id = self.db.insert(record)
         print(f"Inserted record for {ticker} with {len(url_keys)} URL keys")
         return doc_id
     
-    def fetch_records(self, ticker: str) -> Tuple[Optional[List[str]], Optional[str], bool]:
+    @staticmethod
+    def ttl_for(ticker: str) -> float:
+        """Freshness of a ticker's snapshot in seconds: per ticker, else per market suffix, else default."""
+        freshness = configure.chart_freshness
+        if ticker in freshness["ticker_ttl_seconds"]:
+            return freshness["ticker_ttl_seconds"][ticker]
+        market = ticker.rsplit(".", 1)[1] if "." in ticker else ""
+        return freshness["market_ttl_seconds"].get(market, freshness["default_ttl_seconds"])
+    
+    @staticmethod
+    def _snapshot_age(record: Dict) -> float:
+        """Age of a snapshot in seconds."""
+        time_created_ts = record.get('time_created_ts')
+        if time_created_ts is None:
+            # snapshot written before the epoch field existed
+            time_created_ts = calendar.timegm(time.strptime(record['time_created'], "%Y-%m-%d %H:%M:%S"))
+        return time.time() - time_created_ts
+    
+    def seconds_to_expiry(self, ticker: str) -> Optional[float]:
+        """Seconds until the latest snapshot of a ticker expires (negative once expired), None if there is none."""
+        latest_record = self.db.lookup("latest_index", [ticker])[ticker]
+        if latest_record is None:
+            return None
+        return self.ttl_for(ticker) - self._snapshot_age(latest_record)
+    
+    def check_freshness(self, ticker: str) -> Tuple[Optional[List[str]], Optional[str], str, Optional[str]]:
         """
-        Fetch records for a ticker and check if latest record is expired.
+        Fetch the latest snapshot of a ticker and classify its age.
         
         Args:
             ticker: Ticker symbol to search for
             
         Returns:
-            Tuple of (url_keys, time_created, expired)
-            Returns (None, None, True) if no records found
+            Tuple of (url_keys, time_created, state, org) with state "fresh", "stale" (expired by
+            less than stale_seconds: usable while a refresh runs) or "expired"
+            Returns (None, None, "expired", None) if no records found
         """
-        Record = Query()
-        records = self.db.search(Record.ticker == ticker)
+        # one key lookup: the index maps each ticker to its latest snapshot
+        latest_record = self.db.lookup("latest_index", [ticker])[ticker]
         
-        if not records:
-            return None, None, True, None
-        
-        # Find the latest record by time_created
-        records_with_dt = []
-        for record in records:
-            record_copy = record.copy()
-            record_copy['dt'] = dt.strptime(record['time_created'], "%Y-%m-%d %H:%M:%S")
-            records_with_dt.append(record_copy)
-
-        latest_record = max(records_with_dt, key=lambda x: x['dt'])
+        if latest_record is None:
+            return None, None, "expired", None
         
         url_keys = latest_record['url_keys']
         time_created_str = latest_record['time_created']
         org = latest_record['org']
         
-        # Check if record is older than 24 hours
-        time_created = dt.strptime(time_created_str, "%Y-%m-%d %H:%M:%S")
-        time_now = dt.utcnow()
-        time_diff = time_now - time_created
-        expired = time_diff > timedelta(hours=24)
+        age = self._snapshot_age(latest_record)
+        ttl = self.ttl_for(ticker)
+        stale_seconds = configure.chart_freshness["stale_seconds"]
+        
+        if age <= ttl:
+            state = "fresh"
+        elif stale_seconds is not None and age <= ttl + stale_seconds:
+            state = "stale"
+        else:
+            state = "expired"
+        return url_keys, time_created_str, state, org
+    
+    def fetch_records(self, ticker: str) -> Tuple[Optional[List[str]], Optional[str], bool]:
+        """
+        Fetch records for a ticker and check if latest record is expired.
         
-        return url_keys, time_created_str, expired, org
+        Args:
+            ticker: Ticker symbol to search for
+            
+        Returns:
+            Tuple of (url_keys, time_created, expired)
+            Returns (None, None, True) if no records found
+        """
+        url_keys, time_created_str, state, org = self.check_freshness(ticker)
+        return url_keys, time_created_str, state != "fresh", org
     
     def check_latest(self, ticker: str) -> Tuple[Optional[List[str]], Optional[str], bool]:
         """
@@ -97,10 +147,7 @@ class ChartDB:
         Returns:
             Tuple of (url_keys, time_created, expired)
         """
-        # Ensure DB is initialized
-        self._initialize_db()
-        
-        # Fetch and check records
+        # the backend reads the live store on every call - no reopen needed
         return self.fetch_records(ticker)
     
     def get_all_records(self, ticker: str = None) -> List[Dict[str, Any]]:
@@ -114,10 +161,47 @@ class ChartDB:
             List of all matching records
         """
         if ticker:
-            Record = Query()
-            return self.db.search(Record.ticker == ticker)
+            # oldest first, as stored
+            return list(reversed(self.db.recent("ticker_index", ticker)))
         return self.db.all()
     
+    def get_tickers(self) -> List[str]:
+        """All tickers with at least one snapshot."""
+        return self.db.values("ticker_index")
+    
+    def compact(self, tickers: Optional[List[str]] = None, keep_latest: int = 3,
+                max_age_days: Optional[float] = None) -> int:
+        """
+        Drop old snapshots: keep at most `keep_latest` per ticker and, if max_age_days is set,
+        none older than that - except the latest one, so a ticker is never forgotten.
+        
+        Args:
+            tickers: Tickers to compact (default: all)
+            keep_latest: Snapshots kept per ticker
+            max_age_days: Maximum age of the snapshots behind the latest
+            
+        Returns:
+            Number of records removed
+        """
+        cutoff = None
+        if max_age_days is not None:
+            cutoff = (dt.utcnow() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        
+        to_remove = []
+        for ticker in (self.get_tickers() if tickers is None else tickers):
+            # newest first, read from the index without loading the records
+            for rank, (doc_id, time_created) in enumerate(self.db.history("ticker_index", ticker)):
+                if rank == 0:
+                    continue
+                if rank >= max(keep_latest, 1) or (cutoff is not None and time_created < cutoff):
+                    to_remove.append(doc_id)
+        
+        # one write for the whole batch
+        removed = self.db.remove(to_remove)
+        if removed:
+            print(f"Removed {removed} chart snapshots")
+        return removed
+    
     
 # class JobRegisterMg:
 #     def __init__(self, db_path: str):
@@ -265,29 +349,33 @@ class ChartDB:
     
 
 class NewsManager:
-    def __init__(self, db_path: str):
+    # storage layout, shared by every engine (see dbutils/storage_backends.py)
+    storage_spec = {
+        "table": "news",
+        "order_field": "create_time",
+        "key_indexes": {"url_index": ("url",)},
+    }
+    
+    def __init__(self, db_path: str, engine: Optional[str] = None):
         """
-        Initialize News Manager with TinyDB.
+        Initialize News Manager.
         
         Args:
             db_path: Path to the JSON database file (e.g., "data/news_db.json")
+            engine: Storage engine, "tinydb" or "sqlite" (defaults to config db_engine)
         """
         self.db_path = db_path
+        self.engine = engine or configure.db_engine
         self.db = None
         self._check_db()
     
     def _check_db(self):
         """Check if DB exists, create with example record if not."""
-        # Create directory if needed
-        directory = os.path.dirname(self.db_path)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
-        
-        # Initialize database
-        self.db = TinyDB(self.db_path)
+        # Initialize database (the backend creates the directory if needed)
+        self.db = sb.open_backend(self.engine, self.db_path, **self.storage_spec)
         
         # Check if database is empty and add example record
-        if not self.db.all():
+        if self.db.is_empty():
             example_record = {
                 "url": "https://example.com/news/article1",
                 "title": "Example News Article",
@@ -300,7 +388,7 @@ class NewsManager:
             self.db.insert(example_record)
             print(f"Created new news database with example record at {self.db_path}")
     
-    def push_record_initial(self, url: str, title: str, file_path: str = "") -> int:
+    def push_record_initial(self, url: str, title: str, file_path: str = "", content: str = "pending") -> int:
         """
         Push a new news record.
         
@@ -308,22 +396,46 @@ class NewsManager:
             url: News article URL
             title: Article title
             file_path: Path to downloaded file (optional)
+            content: Article text if extracted at crawl time (optional)
             
         Returns:
             Document ID of the inserted record
         """
-        record = {
+        record = self._initial_record(url, title, file_path, content)
+        doc_id = self.db.insert(record)
+        print(f"Added news record: {title}")
+        return doc_id
+    
+    def push_records_initial(self, records: List[Dict]) -> List[int]:
+        """
+        Push several new news records in one write.
+        
+        Args:
+            records: List of dicts with "url", "title" and optional "file_path" / "content"
+            
+        Returns:
+            Document IDs of the inserted records
+        """
+        if not records:
+            return []
+        
+        new_records = [self._initial_record(r["url"], r["title"], r.get("file_path", ""), r.get("content", "pending"))
+                       for r in records]
+        doc_ids = self.db.insert_many(new_records)
+        print(f"Added {len(doc_ids)} news records")
+        return doc_ids
+    
+    @staticmethod
+    def _initial_record(url: str, title: str, file_path: str = "", content: str = "pending") -> Dict:
+        return {
             "url": url,
             "title": title,
             "file_path": file_path,
             "create_time": dt.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
-            "content": "pending",
+            "content": content,
             "summary": "pending",
             "publish_date": ""
         }
-        doc_id = self.db.insert(record)
-        print(f"Added news record: {title}")
-        return doc_id
     
     def fetch_records(self, urls: List[str]) -> Dict[str, Optional[Dict]]:
         """
@@ -335,17 +447,7 @@ class NewsManager:
         Returns:
             Dictionary with URLs as keys and records as values (None if not found)
         """
-        News = Query()
-        results = {}
-        
-        for url in urls:
-            records = self.db.search(News.url == url)
-            if records:
-                results[url] = records[0] # always unique
-            else:
-                results[url] = None
-        
-        return results
+        return self.db.lookup("url_index", urls)
     
     def update_fields(self, url: str, **updates) -> bool:
         """
@@ -358,18 +460,34 @@ class NewsManager:
         Returns:
             True if record was updated, False if not found
         """
-        News = Query()
-        records = self.db.search(News.url == url)
-        
-        if not records:
+        # Update the indexed (most recent) record for this URL
+        if not self.db.update_latest("url_index", url, updates):
             print(f"No record found for URL: {url}")
             return False
         
-        # Update all matching records (usually should be only one)
-        self.db.update(updates, News.url == url)
         print(f"Updated record for {url}: {list(updates.keys())}")
         return True
     
+    def update_many(self, updates: Dict[str, Dict]) -> Dict[str, bool]:
+        """
+        Update fields for several records in one write.
+        
+        Args:
+            updates: Dictionary with URLs as keys and the fields to update as values
+            
+        Returns:
+            Dictionary with URLs as keys and True if updated / False if not found as values
+        """
+        if not updates:
+            return {}
+        
+        found = self.db.update_many_latest("url_index", updates)
+        for url, ok in found.items():
+            if not ok:
+                print(f"No record found for URL: {url}")
+        print(f"Updated {sum(found.values())}/{len(updates)} news records")
+        return found
+    
     def get_all_urls(self) -> List[str]:
         """
         Get all unique URLs in the database.
@@ -377,9 +495,7 @@ class NewsManager:
         Returns:
             List of unique URLs
         """
-        all_records = self.db.all()
-        urls = list(set(record['url'] for record in all_records))
-        return urls
+        return self.db.keys("url_index")
     
     def get_record_by_url(self, url: str) -> Optional[Dict]:
         """
@@ -391,41 +507,40 @@ class NewsManager:
         Returns:
             Record dictionary or None if not found
         """
-        News = Query()
-        records = self.db.search(News.url == url)
-        
-        if not records:
-            return None
-        
-        # Return the most recent record
-        return max(records, key=lambda x: dt.strptime(x['create_time'], "%Y-%m-%d %H:%M:%S"))
+        # The url index always resolves to the most recent record
+        return self.db.lookup("url_index", [url])[url]
     
     
     
 class NewsCropDatabase:
-    def __init__(self, json_file_path: str):
+    # storage layout, shared by every engine (see dbutils/storage_backends.py)
+    storage_spec = {
+        "table": "fragments",
+        "order_field": "time_created",
+        "key_indexes": {"pair_index": ("ticker", "url")},
+        "ordered_indexes": {"ticker_index": "ticker"},
+    }
+    
+    def __init__(self, json_file_path: str, engine: Optional[str] = None):
         """
-        Initialize News Crop Database with TinyDB.
+        Initialize News Crop Database.
         
         Args:
             json_file_path: Path to the JSON database file
+            engine: Storage engine, "tinydb" or "sqlite" (defaults to config db_engine)
         """
         self.json_file_path = json_file_path
+        self.engine = engine or configure.db_engine
         self.db = None
         self._check_db()
     
     def _check_db(self):
         """Check if DB exists, create with example record if not."""
-        # Create directory if needed
-        directory = os.path.dirname(self.json_file_path)
-        if directory:
-            os.makedirs(directory, exist_ok=True)
-        
-        # Initialize database
-        self.db = TinyDB(self.json_file_path)
+        # Initialize database (the backend creates the directory if needed)
+        self.db = sb.open_backend(self.engine, self.json_file_path, **self.storage_spec)
         
         # Check if database is empty and add example record
-        if not self.db.all():
+        if self.db.is_empty():
             example_rcd = {
                 "org": "mock_company",
                 "ticker": "mock.HK",
@@ -459,6 +574,28 @@ class NewsCropDatabase:
         print(f"Inserted record for {record_data.get('ticker', 'unknown')} - {record_data.get('title', 'no title')}")
         return doc_id
     
+    def insert_records(self, records: List[Dict]) -> List[int]:
+        """
+        Insert several records in one write.
+        
+        Args:
+            records: List of dictionaries containing record fields
+            
+        Returns:
+            Document IDs of the inserted records
+        """
+        if not records:
+            return []
+        
+        time_now = dt.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        for record_data in records:
+            if 'time_created' not in record_data:
+                record_data['time_created'] = time_now
+        
+        doc_ids = self.db.insert_many(records)
+        print(f"Inserted {len(doc_ids)} records for {sorted(set(r.get('ticker', 'unknown') for r in records))}")
+        return doc_ids
+    
     def fetch_records(self, ticker: str, limit: int = 10) -> List[Dict]:
         """
         Fetch records for a specific ticker, return top N most recent.
@@ -470,16 +607,8 @@ class NewsCropDatabase:
         Returns:
             List of records sorted by time_created (newest first)
         """
-        News = Query()
-        records = self.db.search(News.ticker == ticker)
-        
-        if not records:
-            return []
-        
-        # Sort by time_created descending (newest first)
-        records.sort(key=lambda x: dt.strptime(x['time_created'], "%Y-%m-%d %H:%M:%S"), reverse=True)
-        
-        return records[:limit]
+        # The ticker index is in time_created order, so this only reads `limit` records
+        return self.db.recent("ticker_index", ticker, limit=limit)
     
     def check_fragments(self, url: str, ticker: str) -> bool:
         """
@@ -492,6 +621,18 @@ class NewsCropDatabase:
         Returns:
             True if record exists, False otherwise
         """
-        News = Query()
-        records = self.db.search((News.url == url) & (News.ticker == ticker))
-        return len(records) > 0
+        return self.db.contains("pair_index", (ticker, url))
+    
+    def missing_fragments(self, urls: List[str], ticker: str) -> List[str]:
+        """
+        Find the URLs without a fragment for the given ticker.
+        
+        Args:
+            urls: URLs to check
+            ticker: Ticker symbol to check
+            
+        Returns:
+            URLs (in input order) that have no record yet
+        """
+        missing = self.db.missing("pair_index", [(ticker, url) for url in urls])
+        return [url for _, url in missing]
@@ -0,0 +1,67 @@
+"""
+Move the plain raw html files of the news DB into the compressed blob store.
+
+Run from the project root, with the worker services stopped:
+    python -m dbutils.migrate_html_store                  # paths / html_store from config/conf.py
+    python -m dbutils.migrate_html_store --delete-files   # also remove the migrated html files
+
+Every news record whose file_path is a plain html file gets the blob reference instead;
+identical pages collapse into one blob. Chart pages are only read once per download and are
+not referenced by records after crawling, so they are left in raw_html_dir.
+"""
+import argparse
+import os
+
+import config.conf as configure
+import dbutils.db_classes as dbs
+from webUtils.htmlStore import HtmlBlobStore, is_blob_ref
+
+
+def migrate_news_html(news_db_path: str, store: HtmlBlobStore, delete_files: bool = False) -> int:
+    """
+    Store every plain html file referenced by the news DB as a blob and repoint its record.
+
+    Args:
+        news_db_path: Path to the news DB
+        store: Target blob store
+        delete_files: Remove each html file once its record points at the blob
+
+    Returns:
+        Number of records migrated
+    """
+    news_db = dbs.NewsManager(news_db_path)
+    records = news_db.fetch_records(news_db.get_all_urls())
+
+    updates = {}
+    migrated_files = set()
+    for url, record in records.items():
+        file_path = (record or {}).get("file_path")
+        if not file_path or is_blob_ref(file_path) or not os.path.exists(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            updates[url] = {"file_path": store.put(f.read())}
+        migrated_files.add(file_path)
+
+    # repoint the records in one write, then drop the files
+    results = news_db.update_many(updates)
+    migrated = sum(1 for ok in results.values() if ok)
+    if delete_files:
+        for file_path in migrated_files:
+            os.remove(file_path)
+    print(f"Migrated {migrated} records ({len(migrated_files)} files) into {store.root}")
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move raw html files of the news DB into the blob store")
+    parser.add_argument("--news-db", default=configure.paths["news_db"])
+    parser.add_argument("--delete-files", action="store_true", help="remove the html files after migrating")
+    args = parser.parse_args()
+
+    if not configure.html_store:
+        parser.error("html_store is disabled in config/conf.py")
+    migrate_news_html(args.news_db, HtmlBlobStore(**configure.html_store), args.delete_files)
+
+
+if __name__ == "__main__":
+    main()
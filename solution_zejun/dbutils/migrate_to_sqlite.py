@@ -0,0 +1,67 @@
+"""
+Import the TinyDB JSON databases into the SQLite engine.
+
+Run from the project root, with the worker services stopped:
+    python -m dbutils.migrate_to_sqlite            # paths from config/conf.py
+    python -m dbutils.migrate_to_sqlite --force    # re-import into non-empty SQLite DBs
+
+doc_ids are preserved, so the SQLite tables line up with the JSON files record for record.
+Then set db_engine = "sqlite" in config/conf.py.
+"""
+import argparse
+import os
+
+import config.conf as configure
+import dbutils.db_classes as dbs
+import dbutils.storage_backends as sb
+
+
+def migrate_db(json_file_path: str, storage_spec: dict, force: bool = False) -> int:
+    """
+    Copy every record of a TinyDB JSON database into its SQLite counterpart.
+
+    Args:
+        json_file_path: Path to the TinyDB JSON file
+        storage_spec: storage_spec of the owning class (ChartDB, NewsManager, NewsCropDatabase)
+        force: Import even if the SQLite table already has records
+
+    Returns:
+        Number of records imported
+    """
+    if not os.path.exists(json_file_path):
+        print(f"Skipping {json_file_path} - file not found")
+        return 0
+
+    source = sb.open_backend("tinydb", json_file_path, **storage_spec)
+    target = sb.open_backend("sqlite", json_file_path, **storage_spec)
+    try:
+        if not target.is_empty() and not force:
+            print(f"Skipping {json_file_path} - {target.path} is not empty (use --force)")
+            return 0
+
+        rows = source.all_with_ids()
+        existing = {doc_id for doc_id, _ in target.all_with_ids()}
+        rows = [(doc_id, record) for doc_id, record in rows if doc_id not in existing]
+        target.insert_many([record for _, record in rows], [doc_id for doc_id, _ in rows])
+        print(f"Imported {len(rows)} records from {json_file_path} into {target.path}")
+        return len(rows)
+    finally:
+        source.close()
+        target.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the TinyDB JSON databases into SQLite")
+    parser.add_argument("--chart-db", default=configure.paths["chart_db"])
+    parser.add_argument("--news-db", default=configure.paths["news_db"])
+    parser.add_argument("--frag-db", default=configure.paths["frag_db"])
+    parser.add_argument("--force", action="store_true", help="import into non-empty SQLite DBs, skipping existing doc_ids")
+    args = parser.parse_args()
+
+    migrate_db(args.chart_db, dbs.ChartDB.storage_spec, args.force)
+    migrate_db(args.news_db, dbs.NewsManager.storage_spec, args.force)
+    migrate_db(args.frag_db, dbs.NewsCropDatabase.storage_spec, args.force)
+
+
+if __name__ == "__main__":
+    main()
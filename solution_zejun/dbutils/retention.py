@@ -0,0 +1,163 @@
+"""
+Retention for ChartDB snapshots and raw pages.
+
+Run next to the workers (settings from retention in config/conf.py):
+    python -m dbutils.retention           # one pass
+    python -m dbutils.retention --loop    # a pass every interval_seconds
+
+Work is done in batches of batch_size with a short pause in between, so the workers sharing
+the DBs and disks are never held up for long.
+"""
+import argparse
+import os
+import time
+from datetime import datetime as dt, timedelta
+from typing import Dict, List, Optional, Set
+
+import config.conf as configure
+import dbutils.db_classes as dbs
+from webUtils.htmlStore import HtmlBlobStore, default_html_store, is_blob_ref
+
+RAW_PAGE_SUFFIXES = (".html", ".html.zst", ".html.gz", ".tmp")
+
+
+class RetentionManager:
+    """
+    Compacts ChartDB to the latest snapshots per ticker and garbage-collects raw pages.
+
+    A raw page (plain html file or blob) is an orphan when no news record references it - chart
+    pages are always orphans once crawled. Orphans are deleted after `orphan_grace_hours`, which
+    covers pages downloaded but not yet recorded. With `raw_html_max_age_days`, pages whose
+    articles are all summarised and older than that are deleted as well, after their records
+    drop the reference.
+    """
+    def __init__(self,
+                 chart_db_path: str,
+                 news_db_path: str,
+                 raw_html_dir: str,
+                 html_store: Optional[HtmlBlobStore] = None,
+                 chart_keep_latest: int = 3,
+                 chart_max_age_days: Optional[float] = 30,
+                 raw_html_max_age_days: Optional[float] = None,
+                 orphan_grace_hours: float = 6,
+                 batch_size: int = 200,
+                 pause_seconds: float = 0.05):
+        self.chart_db = dbs.ChartDB(chart_db_path)
+        self.news_db = dbs.NewsManager(news_db_path)
+        self.raw_html_dir = raw_html_dir
+        self.html_store = html_store
+        self.chart_keep_latest = chart_keep_latest
+        self.chart_max_age_days = chart_max_age_days
+        self.raw_html_max_age_days = raw_html_max_age_days
+        self.orphan_grace_hours = orphan_grace_hours
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+
+    def _batches(self, items: List) -> List[List]:
+        return [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+
+    def compact_charts(self) -> int:
+        """Compact ChartDB a batch of tickers at a time. Returns the number of snapshots removed."""
+        removed = 0
+        for tickers in self._batches(self.chart_db.get_tickers()):
+            removed += self.chart_db.compact(tickers, self.chart_keep_latest, self.chart_max_age_days)
+            time.sleep(self.pause_seconds)
+        return removed
+
+    def _file_of(self, file_path: str) -> Optional[str]:
+        """Normalised file path of a record's file_path (blob reference or plain path)."""
+        if is_blob_ref(file_path):
+            return os.path.abspath(self.html_store.path_of(file_path)) if self.html_store else None
+        return os.path.abspath(file_path)
+
+    def _raw_files(self) -> List[str]:
+        roots = [self.raw_html_dir] + ([self.html_store.root] if self.html_store else [])
+        files = []
+        for root in roots:
+            for directory, _, names in os.walk(root):
+                files.extend(os.path.abspath(os.path.join(directory, name))
+                             for name in names if name.endswith(RAW_PAGE_SUFFIXES))
+        return files
+
+    def _expired_articles(self, records: Dict[str, Optional[Dict]]) -> Set[str]:
+        """URLs whose article is summarised and older than raw_html_max_age_days."""
+        if self.raw_html_max_age_days is None:
+            return set()
+        cutoff = (dt.utcnow() - timedelta(days=self.raw_html_max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        return {url for url, record in records.items()
+                if record and record.get("summary") not in [None, "pending"]
+                and record.get("content") not in [None, "", "pending"]
+                and record.get("create_time", "") < cutoff}
+
+    def collect_raw_pages(self) -> Dict[str, int]:
+        """
+        Delete orphaned raw pages and, if configured, the pages of old summarised articles.
+
+        Returns:
+            Dictionary with the numbers of "orphans" and "expired" pages removed
+        """
+        records = self.news_db.fetch_records(self.news_db.get_all_urls())
+        expired_urls = self._expired_articles(records)
+
+        urls_of: Dict[str, List[str]] = {}
+        for url, record in records.items():
+            file_path = (record or {}).get("file_path")
+            if file_path and file_path != "pending":
+                path = self._file_of(file_path)
+                if path is not None:
+                    urls_of.setdefault(path, []).append(url)
+
+        # a shared blob goes only when every article using it has expired
+        expired = {path: urls for path, urls in urls_of.items() if all(url in expired_urls for url in urls)}
+        if expired:
+            self.news_db.update_many({url: {"file_path": ""} for urls in expired.values() for url in urls})
+
+        grace_cutoff = time.time() - self.orphan_grace_hours * 3600
+        counts = {"orphans": 0, "expired": 0}
+        candidates = [path for path in self._raw_files() if path not in urls_of or path in expired]
+        for batch in self._batches(candidates):
+            for path in batch:
+                try:
+                    # recently written or re-used pages may be about to be recorded
+                    if os.path.getmtime(path) > grace_cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                counts["expired" if path in expired else "orphans"] += 1
+            time.sleep(self.pause_seconds)
+        print(f"Removed {counts['orphans']} orphaned and {counts['expired']} expired raw pages")
+        return counts
+
+    def run_once(self) -> Dict[str, int]:
+        """One full retention pass."""
+        stats = {"chart_snapshots": self.compact_charts()}
+        stats.update(self.collect_raw_pages())
+        return stats
+
+
+def default_retention_manager() -> RetentionManager:
+    """RetentionManager from paths, html_store and retention in config/conf.py."""
+    settings = {k: v for k, v in configure.retention.items() if k != "interval_seconds"}
+    return RetentionManager(configure.paths["chart_db"],
+                            configure.paths["news_db"],
+                            configure.paths["raw_html_dir"],
+                            html_store=default_html_store(),
+                            **settings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact ChartDB and garbage-collect raw pages")
+    parser.add_argument("--loop", action="store_true", help="run a pass every interval_seconds")
+    args = parser.parse_args()
+
+    manager = default_retention_manager()
+    while True:
+        print(f"Retention pass: {manager.run_once()}")
+        if not args.loop:
+            break
+        time.sleep(configure.retention["interval_seconds"])
+
+
+if __name__ == "__main__":
+    main()
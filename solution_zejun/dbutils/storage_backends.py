@@ -0,0 +1,577 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from tinydb import TinyDB
+from tinydb.middlewares import Middleware
+from tinydb.storages import JSONStorage
+from tinydb.table import Document
+import sqlite3
+import threading
+import bisect
+import json
+import os
+from typing import List, Tuple, Optional, Dict, Any, Union
+
+Key = Union[str, Tuple[str, ...]]
+
+
+class StorageBackend(ABC):
+    """
+    Document store used by ChartDB, NewsManager and NewsCropDatabase.
+
+    A store keeps JSON-like records ordered by `order_field` (a "%Y-%m-%d %H:%M:%S" string)
+    and maintains two kinds of indexes:
+      - key indexes: name -> tuple of fields, resolving a key to its most recent record
+      - ordered indexes: name -> field, listing the records of a value in time order
+    """
+    def __init__(self, path: str, table: str, order_field: str,
+                 key_indexes: Optional[Dict[str, Tuple[str, ...]]] = None,
+                 ordered_indexes: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.table_name = table
+        self.order_field = order_field
+        self.key_indexes = key_indexes or {}
+        self.ordered_indexes = ordered_indexes or {}
+
+    def indexed_fields(self) -> List[str]:
+        """All fields that take part in an index, order field first."""
+        fields = {f for fs in self.key_indexes.values() for f in fs} | set(self.ordered_indexes.values())
+        return [self.order_field] + sorted(fields - {self.order_field})
+
+    @abstractmethod
+    def is_empty(self) -> bool:
+        """True if the store has no records."""
+
+    @abstractmethod
+    def insert(self, record: Dict, doc_id: Optional[int] = None) -> int:
+        """Insert a record, optionally with an explicit doc_id, and return its doc_id."""
+
+    @abstractmethod
+    def insert_many(self, records: List[Dict], doc_ids: Optional[List[int]] = None) -> List[int]:
+        """Insert several records in one write and return their doc_ids."""
+
+    @abstractmethod
+    def all(self) -> List[Dict]:
+        """Every record."""
+
+    @abstractmethod
+    def all_with_ids(self) -> List[Tuple[int, Dict]]:
+        """Every record with its doc_id."""
+
+    @abstractmethod
+    def lookup(self, index: str, keys: List[Key]) -> Dict[Key, Optional[Dict]]:
+        """Resolve keys of a key index to their most recent record (None if not found)."""
+
+    @abstractmethod
+    def missing(self, index: str, keys: List[Key]) -> List[Key]:
+        """Keys (in input order) that have no record in a key index."""
+
+    def contains(self, index: str, key: Key) -> bool:
+        return not self.missing(index, [key])
+
+    @abstractmethod
+    def keys(self, index: str) -> List[Key]:
+        """All distinct keys of a key index."""
+
+    @abstractmethod
+    def recent(self, index: str, value: Any, limit: Optional[int] = None) -> List[Dict]:
+        """Records of an ordered index value, newest first, at most `limit` of them."""
+
+    @abstractmethod
+    def values(self, index: str) -> List[Any]:
+        """All distinct values of an ordered index."""
+
+    @abstractmethod
+    def history(self, index: str, value: Any) -> List[Tuple[int, str]]:
+        """(doc_id, order value) of every record of an ordered index value, newest first, without reading the records."""
+
+    @abstractmethod
+    def remove(self, doc_ids: List[int]) -> int:
+        """Delete records by doc_id in one write. Returns the number removed."""
+
+    def update_latest(self, index: str, key: Key, fields: Dict) -> bool:
+        """Update the most recent record of a key. Returns False if the key is unknown."""
+        return self.update_many_latest(index, {key: fields})[key]
+
+    @abstractmethod
+    def update_many_latest(self, index: str, updates: Dict[Key, Dict]) -> Dict[Key, bool]:
+        """Update the most recent record of several keys in one write. Returns found flags per key."""
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _key_of(record: Dict, fields: Tuple[str, ...]) -> Optional[Key]:
+        if len(fields) == 1:
+            return record.get(fields[0])
+        return tuple(record.get(f) for f in fields)
+
+
+class _BatchingMiddleware(Middleware):
+    """
+    TinyDB storage middleware that can group writes: inside batch() the JSON data is read once,
+    kept in memory and written once when the outermost batch ends (not at all if it fails).
+    """
+    def __init__(self, storage_cls=JSONStorage):
+        super().__init__(storage_cls)
+        self._depth = 0
+        self._data = None
+        self._dirty = False
+
+    def read(self):
+        if not self._depth:
+            return self.storage.read()
+        if self._data is None:
+            self._data = self.storage.read()
+        return self._data
+
+    def write(self, data):
+        if not self._depth:
+            self.storage.write(data)
+            return
+        self._data = data
+        self._dirty = True
+
+    @contextmanager
+    def batch(self):
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            if self._depth == 1:
+                self._data, self._dirty = None, False
+            raise
+        finally:
+            self._depth -= 1
+        if not self._depth:
+            if self._dirty:
+                self.storage.write(self._data)
+            self._data, self._dirty = None, False
+
+    def close(self):
+        self.storage.close()
+
+
+class TinyDBBackend(StorageBackend):
+    """
+    TinyDB engine. Records live in the default table of the JSON file (same layout as before),
+    each index is a single document in its own table of the same file:
+      - key index: {key: doc_id}, multi-field keys joined with "|"
+      - ordered index: {value: [[order_value, doc_id], ...]} sorted ascending
+    Indexes are updated on every write and rebuilt from a full scan if missing or stale.
+    An insert or removal writes its records and their index entries in one storage write
+    (grouped by _BatchingMiddleware).
+    """
+    index_doc_id = 1
+
+    def __init__(self, path: str, table: str, order_field: str,
+                 key_indexes: Optional[Dict[str, Tuple[str, ...]]] = None,
+                 ordered_indexes: Optional[Dict[str, str]] = None):
+        super().__init__(path, table, order_field, key_indexes, ordered_indexes)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.tinydb = TinyDB(path, storage=_BatchingMiddleware())
+        self.storage = self.tinydb.storage
+        self.table = self.tinydb.table(TinyDB.default_table_name)
+        # Rebuild the indexes if they are missing (new DB or DB written by older code)
+        for name in self._index_names():
+            self._load_index(name)
+
+    def _index_names(self) -> List[str]:
+        return list(self.key_indexes) + list(self.ordered_indexes)
+
+    @staticmethod
+    def _encode_key(key: Key) -> str:
+        if isinstance(key, tuple):
+            return "|".join(str(k) for k in key)
+        return key
+
+    def _read_index(self, name: str) -> Optional[Dict]:
+        index = self.tinydb.table(name).get(doc_id=self.index_doc_id)
+        return None if index is None else dict(index)
+
+    def _load_index(self, name: str) -> Dict:
+        index = self._read_index(name)
+        if index is None:
+            return self.rebuild_indexes()[name]
+        return index
+
+    def rebuild_indexes(self) -> Dict[str, Dict]:
+        """
+        Rebuild every index from a full scan of the records.
+
+        Returns:
+            Dictionary with index names as keys and the rebuilt indexes as values
+        """
+        indexes = {name: {} for name in self._index_names()}
+        latest = {name: {} for name in self.key_indexes}
+        for record in self.table.all():
+            # "%Y-%m-%d %H:%M:%S" sorts chronologically as a string, doc_id breaks ties
+            order = [record.get(self.order_field, ''), record.doc_id]
+            for name, fields in self.key_indexes.items():
+                key = self._key_of(record, fields)
+                if key is None:
+                    continue
+                key = self._encode_key(key)
+                if key not in latest[name] or order > latest[name][key]:
+                    latest[name][key] = order
+                    indexes[name][key] = record.doc_id
+            for name, field in self.ordered_indexes.items():
+                value = record.get(field)
+                if value is None:
+                    continue
+                indexes[name].setdefault(value, []).append(order)
+        for name in self.ordered_indexes:
+            for entries in indexes[name].values():
+                entries.sort()
+
+        with self.storage.batch():
+            for name, index in indexes.items():
+                index_table = self.tinydb.table(name)
+                index_table.truncate()
+                index_table.insert(Document(index, doc_id=self.index_doc_id))
+        print(f"Rebuilt indexes {list(indexes)} at {self.path}")
+        return indexes
+
+    def _index_records(self, indexes: Dict[str, Dict], records: List[Tuple[int, Dict]]):
+        """Add freshly inserted records to the (in-memory) index documents."""
+        for name, fields in self.key_indexes.items():
+            for doc_id, record in records:
+                key = self._key_of(record, fields)
+                if key is not None:
+                    indexes[name][self._encode_key(key)] = doc_id
+
+        for name, field in self.ordered_indexes.items():
+            for doc_id, record in records:
+                value = record.get(field)
+                if value is not None:
+                    bisect.insort(indexes[name].setdefault(value, []), [record.get(self.order_field, ''), doc_id])
+
+    def _get(self, doc_ids: List[int]) -> Dict[int, Document]:
+        """Read documents by id with a single table read."""
+        if not doc_ids:
+            return {}
+        return {doc.doc_id: doc for doc in self.table.get(doc_ids=doc_ids)}
+
+    def is_empty(self) -> bool:
+        return len(self.table) == 0
+
+    def insert(self, record: Dict, doc_id: Optional[int] = None) -> int:
+        return self.insert_many([record], None if doc_id is None else [doc_id])[0]
+
+    def insert_many(self, records: List[Dict], doc_ids: Optional[List[int]] = None) -> List[int]:
+        if not records:
+            return []
+        # one read and one write of the JSON file for the records and every index
+        with self.storage.batch():
+            if doc_ids is None:
+                doc_ids = self.table.insert_multiple(records)
+            else:
+                doc_ids = [self.table.insert(Document(record, doc_id=doc_id))
+                           for doc_id, record in zip(doc_ids, records)]
+
+            indexes = {name: self._read_index(name) for name in self._index_names()}
+            if any(index is None for index in indexes.values()):
+                # rebuilding picks up the freshly inserted records as well
+                self.rebuild_indexes()
+            else:
+                self._index_records(indexes, list(zip(doc_ids, records)))
+                for name, index in indexes.items():
+                    self.tinydb.table(name).update(index, doc_ids=[self.index_doc_id])
+        return list(doc_ids)
+
+    def all(self) -> List[Dict]:
+        return self.table.all()
+
+    def all_with_ids(self) -> List[Tuple[int, Dict]]:
+        return [(doc.doc_id, dict(doc)) for doc in self.table.all()]
+
+    def lookup(self, index: str, keys: List[Key]) -> Dict[Key, Optional[Dict]]:
+        fields = self.key_indexes[index]
+        for attempt in range(2):
+            key_index = self._load_index(index) if attempt == 0 else self.rebuild_indexes()[index]
+            encoded = {key: self._encode_key(key) for key in keys}
+            docs = self._get([key_index[k] for k in encoded.values() if k in key_index])
+
+            results = {}
+            stale = False
+            for key, encoded_key in encoded.items():
+                if encoded_key not in key_index:
+                    results[key] = None
+                    continue
+                record = docs.get(key_index[encoded_key])
+                if record is None or self._encode_key(self._key_of(record, fields)) != encoded_key:
+                    # index points to a removed or replaced record
+                    stale = True
+                    break
+                results[key] = record
+
+            if not stale:
+                return results
+
+        raise RuntimeError(f"index {index} for {self.path} is inconsistent after rebuild")
+
+    def missing(self, index: str, keys: List[Key]) -> List[Key]:
+        key_index = self._load_index(index)
+        return [key for key in keys if self._encode_key(key) not in key_index]
+
+    def keys(self, index: str) -> List[Key]:
+        keys = list(self._load_index(index).keys())
+        if len(self.key_indexes[index]) > 1:
+            return [tuple(key.split("|")) for key in keys]
+        return keys
+
+    def recent(self, index: str, value: Any, limit: Optional[int] = None) -> List[Dict]:
+        entries = self._load_index(index).get(value, [])
+        if limit is not None:
+            if limit <= 0:
+                return []
+            entries = entries[-limit:]
+
+        # Index entries are in time order, so the newest N are the tail
+        doc_ids = [doc_id for _, doc_id in reversed(entries)]
+        docs = self._get(doc_ids)
+        if len(docs) != len(doc_ids):
+            # index points to removed records
+            self.rebuild_indexes()
+            return self.recent(index, value, limit)
+        return [docs[doc_id] for doc_id in doc_ids]
+
+    def values(self, index: str) -> List[Any]:
+        return list(self._load_index(index).keys())
+
+    def history(self, index: str, value: Any) -> List[Tuple[int, str]]:
+        return [(doc_id, order) for order, doc_id in reversed(self._load_index(index).get(value, []))]
+
+    def remove(self, doc_ids: List[int]) -> int:
+        doc_ids = list(self._get(doc_ids))
+        if not doc_ids:
+            return 0
+        with self.storage.batch():
+            return self._remove(doc_ids)
+
+    def _remove(self, doc_ids: List[int]) -> int:
+        self.table.remove(doc_ids=doc_ids)
+
+        removed = set(doc_ids)
+        key_indexes = {name: self._read_index(name) for name in self.key_indexes}
+        if any(index is None or removed & set(index.values()) for index in key_indexes.values()):
+            # an older record may become the latest of its key - only a scan can tell
+            self.rebuild_indexes()
+            return len(doc_ids)
+        for name in self.ordered_indexes:
+            index = self._read_index(name)
+            if index is None:
+                self.rebuild_indexes()
+                return len(doc_ids)
+            touched = {value: [entry for entry in entries if entry[1] not in removed]
+                       for value, entries in index.items() if any(entry[1] in removed for entry in entries)}
+            if touched:
+                self.tinydb.table(name).update(touched, doc_ids=[self.index_doc_id])
+        return len(doc_ids)
+
+    def update_many_latest(self, index: str, updates: Dict[Key, Dict]) -> Dict[Key, bool]:
+        fields_of = self.key_indexes[index]
+        records = self.lookup(index, list(updates))
+        found = {key: record for key, record in records.items() if record is not None}
+        pending = {self._encode_key(key): updates[key] for key in found}
+
+        def apply_update(doc: Dict):
+            doc.update(pending[self._encode_key(self._key_of(doc, fields_of))])
+
+        if found:
+            # one table rewrite for the whole batch, restricted to the latest record of each key
+            self.table.update(apply_update, doc_ids=[record.doc_id for record in found.values()])
+            if any(set(fields) & set(self.indexed_fields()) for fields in pending.values()):
+                self.rebuild_indexes()
+        return {key: key in found for key in updates}
+
+    def close(self):
+        self.tinydb.close()
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    SQLite engine in WAL mode, safe for the worker services and the app writing concurrently.
+    Each store is one table: doc_id, one column per indexed field, and the full record as JSON.
+    Key and ordered indexes become real SQLite indexes on (fields..., order_field).
+    """
+    def __init__(self, path: str, table: str, order_field: str,
+                 key_indexes: Optional[Dict[str, Tuple[str, ...]]] = None,
+                 ordered_indexes: Optional[Dict[str, str]] = None):
+        super().__init__(path, table, order_field, key_indexes, ordered_indexes)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.columns = self.indexed_fields()
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        columns = ", ".join(f'"{col}" TEXT' for col in self.columns)
+        with self._lock, self.conn:
+            self.conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.table_name}" '
+                f'(doc_id INTEGER PRIMARY KEY AUTOINCREMENT, {columns}, doc TEXT NOT NULL)'
+            )
+            index_fields = {name: (field,) for name, field in self.ordered_indexes.items()}
+            index_fields.update({name: tuple(fields) for name, fields in self.key_indexes.items()})
+            created = set()
+            for name, fields in index_fields.items():
+                on = ", ".join(f'"{f}"' for f in fields + (self.order_field,))
+                # a key index and an ordered index on the same field share one SQLite index
+                if on in created:
+                    continue
+                created.add(on)
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.table_name}_{name}" ON "{self.table_name}" ({on})')
+
+    def _where(self, fields: Tuple[str, ...]) -> str:
+        return " AND ".join(f'"{f}" = ?' for f in fields)
+
+    def _order_desc(self) -> str:
+        return f'ORDER BY "{self.order_field}" DESC, doc_id DESC'
+
+    @staticmethod
+    def _key_values(key: Key) -> Tuple:
+        return key if isinstance(key, tuple) else (key,)
+
+    def _row_values(self, record: Dict) -> List:
+        return [record.get(col) for col in self.columns]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self.conn.execute(f'SELECT 1 FROM "{self.table_name}" LIMIT 1').fetchone() is None
+
+    def insert(self, record: Dict, doc_id: Optional[int] = None) -> int:
+        return self.insert_many([record], None if doc_id is None else [doc_id])[0]
+
+    def insert_many(self, records: List[Dict], doc_ids: Optional[List[int]] = None) -> List[int]:
+        columns = ", ".join(["doc_id"] + [f'"{col}"' for col in self.columns] + ["doc"])
+        marks = ", ".join("?" * (len(self.columns) + 2))
+        sql = f'INSERT INTO "{self.table_name}" ({columns}) VALUES ({marks})'
+        if doc_ids is None:
+            doc_ids = [None] * len(records)
+
+        new_ids = []
+        # one transaction, one commit for the whole batch
+        with self._lock, self.conn:
+            for record, doc_id in zip(records, doc_ids):
+                cursor = self.conn.execute(sql, [doc_id] + self._row_values(record) + [json.dumps(record)])
+                new_ids.append(cursor.lastrowid)
+        return new_ids
+
+    def all(self) -> List[Dict]:
+        return [record for _, record in self.all_with_ids()]
+
+    def all_with_ids(self) -> List[Tuple[int, Dict]]:
+        with self._lock:
+            rows = self.conn.execute(f'SELECT doc_id, doc FROM "{self.table_name}" ORDER BY doc_id').fetchall()
+        return [(doc_id, json.loads(doc)) for doc_id, doc in rows]
+
+    def _latest_row(self, index: str, key: Key) -> Optional[Tuple[int, str]]:
+        sql = (f'SELECT doc_id, doc FROM "{self.table_name}" '
+               f'WHERE {self._where(self.key_indexes[index])} {self._order_desc()} LIMIT 1')
+        return self.conn.execute(sql, self._key_values(key)).fetchone()
+
+    def lookup(self, index: str, keys: List[Key]) -> Dict[Key, Optional[Dict]]:
+        results = {}
+        with self._lock:
+            for key in keys:
+                row = self._latest_row(index, key)
+                results[key] = None if row is None else json.loads(row[1])
+        return results
+
+    def missing(self, index: str, keys: List[Key]) -> List[Key]:
+        sql = f'SELECT 1 FROM "{self.table_name}" WHERE {self._where(self.key_indexes[index])} LIMIT 1'
+        with self._lock:
+            return [key for key in keys if self.conn.execute(sql, self._key_values(key)).fetchone() is None]
+
+    def keys(self, index: str) -> List[Key]:
+        fields = self.key_indexes[index]
+        columns = [f'"{f}"' for f in fields]
+        not_null = " AND ".join(f"{col} IS NOT NULL" for col in columns)
+        sql = f'SELECT DISTINCT {", ".join(columns)} FROM "{self.table_name}" WHERE {not_null}'
+        with self._lock:
+            rows = self.conn.execute(sql).fetchall()
+        return [row[0] if len(fields) == 1 else tuple(row) for row in rows]
+
+    def recent(self, index: str, value: Any, limit: Optional[int] = None) -> List[Dict]:
+        field = self.ordered_indexes[index]
+        sql = f'SELECT doc FROM "{self.table_name}" WHERE "{field}" = ? {self._order_desc()} LIMIT ?'
+        with self._lock:
+            rows = self.conn.execute(sql, (value, -1 if limit is None else limit)).fetchall()
+        return [json.loads(doc) for doc, in rows]
+
+    def values(self, index: str) -> List[Any]:
+        field = self.ordered_indexes[index]
+        sql = f'SELECT DISTINCT "{field}" FROM "{self.table_name}" WHERE "{field}" IS NOT NULL'
+        with self._lock:
+            return [value for value, in self.conn.execute(sql).fetchall()]
+
+    def history(self, index: str, value: Any) -> List[Tuple[int, str]]:
+        field = self.ordered_indexes[index]
+        sql = f'SELECT doc_id, "{self.order_field}" FROM "{self.table_name}" WHERE "{field}" = ? {self._order_desc()}'
+        with self._lock:
+            return [tuple(row) for row in self.conn.execute(sql, (value,)).fetchall()]
+
+    def remove(self, doc_ids: List[int]) -> int:
+        removed = 0
+        # one transaction, one commit for the whole batch
+        with self._lock, self.conn:
+            for doc_id in doc_ids:
+                removed += self.conn.execute(f'DELETE FROM "{self.table_name}" WHERE doc_id = ?', (doc_id,)).rowcount
+        return removed
+
+    def update_many_latest(self, index: str, updates: Dict[Key, Dict]) -> Dict[Key, bool]:
+        assignments = ", ".join(f'"{col}" = ?' for col in self.columns)
+        sql = f'UPDATE "{self.table_name}" SET {assignments}, doc = ? WHERE doc_id = ?'
+        found = {}
+        # one transaction, one commit for the whole batch
+        with self._lock, self.conn:
+            for key, fields in updates.items():
+                row = self._latest_row(index, key)
+                found[key] = row is not None
+                if row is None:
+                    continue
+                doc_id, doc = row
+                record = json.loads(doc)
+                record.update(fields)
+                self.conn.execute(sql, self._row_values(record) + [json.dumps(record), doc_id])
+        return found
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+BACKENDS = {
+    "tinydb": TinyDBBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def sqlite_path(json_file_path: str) -> str:
+    """SQLite file used in place of a TinyDB JSON file, e.g. news_db.json -> news_db.sqlite"""
+    return os.path.splitext(json_file_path)[0] + ".sqlite"
+
+
+def open_backend(engine: str, path: str, **spec) -> StorageBackend:
+    """
+    Open a storage backend.
+
+    Args:
+        engine: "tinydb" or "sqlite"
+        path: TinyDB JSON file path; the SQLite engine uses the sibling ".sqlite" file
+        **spec: table, order_field, key_indexes, ordered_indexes
+
+    Returns:
+        The opened backend
+    """
+    if engine not in BACKENDS:
+        raise ValueError(f"Unknown storage engine: {engine} (expected one of {list(BACKENDS)})")
+    if engine == "sqlite":
+        path = sqlite_path(path)
+    return BACKENDS[engine](path, **spec)
@@ -1,5 +1,4 @@
 import streamlit as st
-import time
 from datetime import datetime as dt
 from typing import Dict, List, Optional
 import redis
@@ -28,7 +27,7 @@ def set_recource():
     if "frag_db" not in st.session_state:
         st.session_state.frag_db = dbs.NewsCropDatabase(configure.paths['frag_db'])
     if 'job_queue' not in st.session_state:
-        st.session_state.job_queue = rq.RQJobQ()
+        st.session_state.job_queue = rq.default_job_queue()
     if 'user_id' not in st.session_state:
         st.session_state.user_id = ""
     if 'session_id' not in st.session_state:
@@ -77,6 +76,13 @@ def user_session_attachment():
     return True
 
     
+def add_fragments(fragments):
+    """Add fragments to the session's insights, newest first, each (ticker, url) once."""
+    known = {(fragment.get('ticker'), fragment.get('url')) for fragment in st.session_state.fragments}
+    new = [fragment for fragment in fragments if (fragment.get('ticker'), fragment.get('url')) not in known]
+    st.session_state.fragments = new + st.session_state.fragments
+
+
 def render_insight_panel(left_panel):
     with left_panel:
         st.subheader("Insight Panel")
@@ -101,14 +107,23 @@ def render_insight_panel(left_panel):
             st.session_state.current_job_id = job_id
             st.session_state.job_status = "submitted"
             st.session_state.monitoring = True
+            # insights already stored for the ticker are shown at once, new ones join as they come
+            st.session_state.fragments = st.session_state.frag_db.fetch_records(
+                ticker, configure.insight_panel["cached_fragments"])
             # st.write("** here -- redis_client **")
             
-            # Push job to Redis queue
+            # Push job to Redis queue, unless a job for this ticker is already in flight
             
             try:
-                st.session_state.job_queue.push_crawler_job(job_id, ticker)
-                num_jobs_in_q = st.session_state.job_queue.RQ.llen(st.session_state.job_queue.crawl_queue_name)
-                st.success(f"Job submitted: {job_id} - currently there are {num_jobs_in_q} jobs in the que")
+                # query counts drive the proactive refresh of hot tickers
+                st.session_state.job_checker.record_query(ticker)
+                leader_job_id = st.session_state.job_checker.attach_flight(ticker, job_id)
+                if leader_job_id:
+                    st.success(f"Job submitted: {job_id} - attached to running job {leader_job_id}")
+                else:
+                    st.session_state.job_queue.push_crawler_job(job_id, ticker)
+                    num_jobs_in_q = st.session_state.job_queue.queue_length(st.session_state.job_queue.crawl_queue_name)
+                    st.success(f"Job submitted: {job_id} - currently there are {num_jobs_in_q} jobs in the que")
             except Exception as e:
                 st.error(f"Failed to submit job: {e}")
                 st.session_state.job_status = "failed"
@@ -118,49 +133,47 @@ def render_insight_panel(left_panel):
         if st.session_state.monitoring and st.session_state.current_job_id:
             st.subheader("Job Status")
             
-            # Create progress area
             status_placeholder = st.empty()
-            progress_placeholder = st.empty()
-            max_retries = 20
-            retry_interval = 5  # seconds
+            live_placeholder = st.empty()
             
-            for attempt in range(max_retries):
-                # Check job status
-                status = st.session_state.job_checker.get_job_status(st.session_state.current_job_id)
-                
+            def show_status(status):
                 st.session_state.job_status = status
+                status_placeholder.info(f"Status: {status}")
+            
+            def show_fragments(fragments):
+                add_fragments(fragments)
+                # plain text while waiting - the cards with buttons are drawn once the job is done
+                with live_placeholder.container():
+                    st.caption(f"{len(st.session_state.fragments)} insights so far")
+                    for fragment in st.session_state.fragments:
+                        st.write(f"- **{fragment.get('related_reason_simple', 'N/A')}**: "
+                                 f"{fragment.get('related_reason_short', '')} ({fragment.get('polarity', 'N/A')})")
+            
+            show_fragments([])
+            # wait for the job's status notifications instead of polling Redis
+            status = st.session_state.job_checker.wait_for_job(
+                st.session_state.current_job_id,
+                timeout=configure.insight_panel["wait_seconds"],
+                on_status=show_status,
+                on_fragments=show_fragments
+            )
+            st.session_state.job_status = status
+            st.session_state.monitoring = False
+            live_placeholder.empty()
+            
+            if "news crops ready" in status.lower():
+                status_placeholder.success(f"✅ Job completed: {status}")
                 
-                # Update status display
-                status_placeholder.info(f"Status: {status} (Attempt {attempt + 1}/{max_retries})")
-                progress_placeholder.progress((attempt + 1) / max_retries)
-                
-                # Check if job is completed
-                if "news crops ready" in status.lower():
-                    status_placeholder.success(f"✅ Job completed: {status}")
-                    progress_placeholder.empty()
-                    
-                    # Fetch fragments
-                    fragments_result = st.session_state.frag_db.fetch_records(ticker)
-                    
-                    if len(fragments_result) > 0:
-                        st.session_state.fragments = fragments_result
-                        st.session_state.monitoring = False
-                    break
-                
-                # Check if job failed
-                if "fail" in status.lower() or "error" in status.lower():
-                    status_placeholder.error(f"❌ Job failed: {status}")
-                    progress_placeholder.empty()
-                    st.session_state.monitoring = False
-                    break
-                
-                # Wait for next check
-                time.sleep(retry_interval)
+                # fragments published before this session was listening (e.g. attached to a running job)
+                add_fragments(st.session_state.frag_db.fetch_records(
+                    ticker, configure.insight_panel["cached_fragments"]))
+            
+            # Check if job failed
+            elif rq.is_terminal_status(status):
+                status_placeholder.error(f"❌ Job failed: {status}")
             
-            else:  # Max retries reached
+            else:  # timed out
                 status_placeholder.warning("⏰ Server is busy. Please try again later.")
-                progress_placeholder.empty()
-                st.session_state.monitoring = False
         
         # Display insights if available
         if st.session_state.fragments:
@@ -0,0 +1,32 @@
+"""
+Background compaction of the job registry in Redis (see JobRegisterMg.compact_registry).
+
+Run next to the workers (settings from job_registry in config/conf.py):
+    python -m redis_q.jobCompactor           # one pass
+    python -m redis_q.jobCompactor --loop    # a pass every interval_seconds
+
+The first pass also gives status lists written before the registry a ttl and registers their jobs.
+"""
+import argparse
+import time
+
+import config.conf as configure
+import redis_q.redisUtils as rq
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune expired jobs from the job registry")
+    parser.add_argument("--loop", action="store_true", help="run a pass every interval_seconds")
+    args = parser.parse_args()
+
+    job_register = rq.JobRegisterMg()
+    while True:
+        job_register.compact_registry(configure.job_registry["batch_size"],
+                                      configure.job_registry["pause_seconds"])
+        if not args.loop:
+            break
+        time.sleep(configure.job_registry["interval_seconds"])
+
+
+if __name__ == "__main__":
+    main()
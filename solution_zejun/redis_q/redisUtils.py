@@ -1,9 +1,132 @@
 import redis
+import calendar
 import json
-from datetime import datetime as dt
+import os
+import socket
+import time
+from collections import Counter, deque
+from datetime import datetime as dt, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import config.conf as configure
+import dbutils.db_classes as dbs
+
+# background chart refreshes (stale-while-revalidate) run as crawler jobs with this id prefix
+REFRESH_JOB_PREFIX = "refresh:"
+
+
+def is_refresh_job(job_id: str) -> bool:
+    """True for a background refresh queued by push_refresh_job rather than a user job."""
+    return job_id.startswith(REFRESH_JOB_PREFIX)
+
+
+def refresh_job_time(job_id: str) -> float:
+    """Epoch seconds at which a refresh job was queued."""
+    return float(job_id.rsplit(":", 1)[1])
+
+
+def as_job_ids(job_ids) -> List[str]:
+    """A job ID or a list of them, as a list."""
+    return [job_ids] if isinstance(job_ids, str) else list(job_ids)
+
+
+def fair_share_key(job_id: str) -> str:
+    """
+    Who a job takes its queue turns as: the user of an app job ("<user_id>@<session_id>@<ticker>@<uid>"),
+    its session for an anonymous user, else "" (all background refreshes share one turn).
+    """
+    parts = job_id.split("@")
+    if len(parts) == 4:
+        return parts[0] or parts[1]
+    return ""
+
+
+# Fair queuing: every lane (a queue or its background lane) keeps one queue per fair share key
+# ("<lane>:user:<key>" list, or "<lane>:stream:<key>" for StreamJobQ), a rotation "<lane>:users"
+# (sorted set of keys with waiting jobs, scored by turns taken), the waiting jobs per key in
+# "<lane>:backlog" and a doorbell list "<lane>:ready" rung by every push.
+# KEYS: rotation, backlog, doorbell, the key's queue (and for streams the lane's set of streams);
+# ARGV: fair share key, job json, "list" / "stream"
+FAIR_PUSH_LUA = """
+if ARGV[3] == 'stream' then
+    redis.call('XADD', KEYS[4], '*', 'job', ARGV[2])
+    redis.call('SADD', KEYS[5], KEYS[4])
+else
+    redis.call('RPUSH', KEYS[4], ARGV[2])
+end
+redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    -- a key joining the rotation starts level with the keys already waiting
+    local head = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    redis.call('ZADD', KEYS[1], head[2] or 0, ARGV[1])
+end
+redis.call('RPUSH', KEYS[3], 1)
+redis.call('LTRIM', KEYS[3], -64, -1)
+return 1
+"""
+
+# Takes one job per turn from the key with the fewest turns, lanes in priority order. Within max jobs
+# turns only the max jobs keys with the fewest turns can be served, so the caller declares their
+# queues up front (fair_candidates); a key that joined the rotation since is served on the next call.
+# KEYS: per lane its rotation, backlog, doorbell and the candidate keys' queues;
+# ARGV: max jobs, "list" / "stream", number of lanes, then per lane the number of candidates and their keys.
+# Returns {stale, {lane index, job json}...}; for streams {lane index, key} turns instead, each one entry
+# the caller reads from the key's stream with its consumer group. stale is 1 if an undeclared key was due.
+FAIR_POP_LUA = """
+local taken = {0}
+local max_jobs = tonumber(ARGV[1])
+local k, a = 1, 4
+for lane = 1, tonumber(ARGV[3]) do
+    local users, backlog, ready = KEYS[k], KEYS[k + 1], KEYS[k + 2]
+    local queues = {}
+    local count = tonumber(ARGV[a])
+    for i = 1, count do
+        queues[ARGV[a + i]] = KEYS[k + 2 + i]
+    end
+    k = k + 3 + count
+    a = a + 1 + count
+    while #taken <= max_jobs do
+        local head = redis.call('ZRANGE', users, 0, 0)
+        if #head == 0 then
+            redis.call('DEL', ready)
+            break
+        end
+        local key = head[1]
+        if not queues[key] then
+            taken[1] = 1
+            return taken
+        end
+        local job = key
+        if ARGV[2] ~= 'stream' then
+            job = redis.call('LPOP', queues[key])
+        end
+        if job then
+            table.insert(taken, {lane, job})
+        end
+        if (not job) or redis.call('HINCRBY', backlog, key, -1) <= 0 then
+            -- nothing left for this key: it leaves the rotation until its next job
+            redis.call('HDEL', backlog, key)
+            redis.call('ZREM', users, key)
+        else
+            redis.call('ZINCRBY', users, 1, key)
+        end
+    end
+end
+return taken
+"""
 
         
 class RQJobQ:
+    """
+    Job queues between the app and the services, as Redis lists.
+    
+    Each queue has a background lane (background_lanes) for refresh jobs and their follow-up
+    jobs, served only while the queue itself is empty. Within a lane, users take turns (see
+    fair_share_key), so a user with a long list of jobs does not hold up the others.
+    A job is gone from the queue once popped; see StreamJobQ for acknowledged delivery.
+    """
+    backend = "list"
+    
     def __init__(self, host = 'localhost', port = 6379, dbId = 0, decode_rsp=True):
         self.RQ = redis.Redis(
             host=host,
@@ -14,6 +137,89 @@ class RQJobQ:
         self.crawl_queue_name = "news_job_queue"
         self.sumary_queue_name = "summary_job_queue"
         self.crop_queue_name = "corp_job_queue"
+        # lower priority than crawl_queue_name: drained only into slots user jobs leave free
+        self.refresh_queue_name = "refresh_job_queue"
+        self.background_lanes = {self.crawl_queue_name: self.refresh_queue_name,
+                                 self.sumary_queue_name: "summary_background_queue",
+                                 self.crop_queue_name: "crop_background_queue"}
+        self._fair_push = self.RQ.register_script(FAIR_PUSH_LUA)
+        self._fair_pop = self.RQ.register_script(FAIR_POP_LUA)
+    
+    def _lane(self, queue_name: str, job_id: str) -> str:
+        """Lane of a job: background refreshes go to the queue's background lane."""
+        if is_refresh_job(job_id):
+            return self.background_lanes.get(queue_name, queue_name)
+        return queue_name
+    
+    def _user_queue(self, lane: str, share_key: str) -> str:
+        return f"{lane}:user:{share_key}"
+    
+    def _push_keys(self, lane: str, share_key: str) -> List[str]:
+        """KEYS of FAIR_PUSH_LUA for a job of the key in the lane."""
+        return [f"{lane}:users", f"{lane}:backlog", f"{lane}:ready", self._user_queue(lane, share_key)]
+    
+    def _push(self, queue_name: str, job_data: dict):
+        lane = self._lane(queue_name, job_data['job_id'])
+        share_key = fair_share_key(job_data['job_id'])
+        self._fair_push(
+            keys=self._push_keys(lane, share_key),
+            args=[share_key, json.dumps(job_data), self.backend]
+        )
+    
+    def _fair_turns(self, lanes: List[str], max_jobs: int) -> List[Tuple[str, str]]:
+        """
+        Up to max_jobs turns, lanes in priority order, users in turn, as (lane, job json) pairs -
+        (lane, fair share key) for streams.
+        """
+        for _ in range(3):
+            # the keys FAIR_POP_LUA may serve: the max_jobs with the fewest turns in each lane
+            pipe = self.RQ.pipeline()
+            for lane in lanes:
+                pipe.zrange(f"{lane}:users", 0, max_jobs - 1)
+            candidates = pipe.execute()
+            keys, args = [], [max_jobs, self.backend, len(lanes)]
+            for lane, share_keys in zip(lanes, candidates):
+                keys += [f"{lane}:users", f"{lane}:backlog", f"{lane}:ready"]
+                keys += [self._user_queue(lane, share_key) for share_key in share_keys]
+                args += [len(share_keys)] + share_keys
+            stale, *taken = self._fair_pop(keys=keys, args=args)
+            turns = [(lanes[int(lane) - 1], job) for lane, job in taken]
+            # a user joined the rotation meanwhile: look again unless this call already served some
+            if turns or not stale:
+                return turns
+        return []
+    
+    def _take(self, lanes: List[str], max_jobs: int) -> List[str]:
+        """Up to max_jobs queued jobs (json), lanes in priority order, users in turn."""
+        return [job_json for _, job_json in self._fair_turns(lanes, max_jobs)]
+    
+    def _pop(self, queue_name: str, max_jobs: int = 1, timeout: float = 30) -> List[dict]:
+        """
+        Take up to max_jobs jobs of a queue and its background lane, waiting up to `timeout`
+        seconds for the first one.
+        
+        Returns:
+            Job dicts, empty if the queue stayed empty for `timeout` seconds
+        """
+        lanes = [queue_name, self.background_lanes[queue_name]]
+        deadline = time.time() + timeout
+        jobs_json = self._take(lanes, max_jobs)
+        while not jobs_json:
+            remaining = deadline - time.time()
+            # every push rings its lane's doorbell; if another worker took the job first, wait again
+            if remaining <= 0 or self.RQ.blpop([f"{lane}:ready" for lane in lanes], timeout=remaining) is None:
+                return []
+            jobs_json = self._take(lanes, max_jobs)
+        print(jobs_json)
+        return [json.loads(job_json) for job_json in jobs_json]
+    
+    def ack(self, job_ids):
+        """Mark jobs as done. Popped list jobs are already gone from their queue, so nothing to do."""
+        pass
+    
+    def queue_length(self, queue_name: str) -> int:
+        """Number of jobs waiting in a queue (or lane)."""
+        return sum(int(count) for count in self.RQ.hvals(f"{queue_name}:backlog"))
     
     def push_crawler_job(self, job_id, ticker):
 
@@ -21,92 +227,594 @@ class RQJobQ:
             'job_id': job_id,
             'data': ticker
         }
-        self.RQ.rpush(self.crawl_queue_name, json.dumps(job_data))
+        self._push(self.crawl_queue_name, job_data)
         print(f"Produced crawler job {job_id} for ticker: {ticker}")
         return job_id
     
     def get_crawler_job(self):
-        _, job_json = self.RQ.blpop(self.crawl_queue_name, timeout=30)
-        print(job_json)
-
-        if job_json:
-            job_data = json.loads(job_json)
-            job_id = job_data['job_id']
-            ticker = job_data['data']
-        return job_id, ticker
+        """Next crawler job as (job_id, ticker), (None, None) if none came within 30 seconds."""
+        jobs = self._pop(self.crawl_queue_name)
+        if not jobs:
+            return None, None
+        return jobs[0]['job_id'], jobs[0]['data']
     
-    def push_summary_job(self, job_id, urls, ticker, org):
-
-        job_data = {
-            'job_id': job_id,
+    def push_refresh_job(self, ticker, lock_seconds=900):
+        """
+        Queue a background re-crawl of a ticker, at most once per `lock_seconds`.
+        
+        Returns:
+            Job ID of the refresh, None if one is already queued or running
+        """
+        if not self.RQ.set(f"refresh_lock:{ticker}", 1, nx=True, ex=lock_seconds):
+            return None
+        job_id = f"{REFRESH_JOB_PREFIX}{ticker}:{int(time.time())}"
+        self._push(self.crawl_queue_name, {'job_id': job_id, 'data': ticker})
+        print(f"Produced refresh job {job_id} for ticker: {ticker}")
+        return job_id
+    
+    def get_crawler_jobs(self, max_jobs=8, timeout=30):
+        """
+        Drain up to max_jobs crawler jobs: block for the first one, then take what is already queued.
+        User jobs come first, users in turn; background refreshes only fill the remaining slots.
+        
+        Returns:
+            List of (job_id, ticker), empty if the queues stayed empty for `timeout` seconds
+        """
+        jobs = self._pop(self.crawl_queue_name, max_jobs, timeout)
+        return [(job_data['job_id'], job_data['data']) for job_data in jobs]
+    
+    @staticmethod
+    def _articles_job(job_id, urls, ticker, org) -> dict:
+        """
+        Summary / cropping job data. job_id may be a list: the jobs waiting for the same articles
+        share one message, queued and acked as its first user job (taking that user's lane and turn).
+        """
+        job_ids = as_job_ids(job_id)
+        lead = next((j for j in job_ids if not is_refresh_job(j)), job_ids[0])
+        return {
+            'job_id': lead,
+            'job_ids': job_ids,
             'data': urls,
             "ticker": ticker, 
             "org": org
         }
-        self.RQ.rpush(self.sumary_queue_name, json.dumps(job_data))
+    
+    @staticmethod
+    def _articles_job_tuple(job_data: dict) -> tuple:
+        return job_data.get('job_ids', [job_data['job_id']]), job_data['data'], job_data["ticker"], job_data["org"]
+    
+    def push_summary_job(self, job_id, urls, ticker, org):
+
+        job_data = self._articles_job(job_id, urls, ticker, org)
+        self._push(self.sumary_queue_name, job_data)
         print(f"Produced summary job {job_id} for urls: n = {len(urls)}")
         return job_id
     
     def get_summary_job(self):
-        _, job_json = self.RQ.blpop(self.sumary_queue_name, timeout=30)
-        print(job_json)
-
-        if job_json:
-            job_data = json.loads(job_json)
-            job_id = job_data['job_id']
-            urls = job_data['data']
-            ticker = job_data["ticker"] 
-            org = job_data["org"]
-        return job_id, urls, ticker, org
+        """Next summary job as (job_id, urls, ticker, org), all None if none came within 30 seconds."""
+        jobs = self._pop(self.sumary_queue_name)
+        if not jobs:
+            return None, None, None, None
+        job_data = jobs[0]
+        return job_data['job_id'], job_data['data'], job_data["ticker"], job_data["org"]
+    
+    def get_summary_jobs(self, max_jobs=8, timeout=30):
+        """
+        Drain up to max_jobs summary jobs: wait for the first one, then take what is already queued.
+        
+        Returns:
+            List of (job_ids, urls, ticker, org), empty if the queue stayed empty for `timeout` seconds
+        """
+        jobs = self._pop(self.sumary_queue_name, max_jobs, timeout)
+        return [self._articles_job_tuple(job_data) for job_data in jobs]
     
     def push_crop_job(self, job_id, urls, ticker, org):
 
-        job_data = {
-            'job_id': job_id,
-            'data': urls,
-            "ticker": ticker, 
-            "org": org
-        }
-        self.RQ.rpush(self.crop_queue_name, json.dumps(job_data))
+        job_data = self._articles_job(job_id, urls, ticker, org)
+        self._push(self.crop_queue_name, job_data)
         print(f"Produced cropping job {job_id} for urls: n = {len(urls)}")
         return job_id
     
     def get_crop_job(self):
-        _, job_json = self.RQ.blpop(self.crop_queue_name, timeout=30)
-        print(job_json)
+        """Next cropping job as (job_id, urls, ticker, org), all None if none came within 30 seconds."""
+        jobs = self._pop(self.crop_queue_name)
+        if not jobs:
+            return None, None, None, None
+        job_data = jobs[0]
+        return job_data['job_id'], job_data['data'], job_data["ticker"], job_data["org"]
+    
+    def get_crop_jobs(self, max_jobs=8, timeout=30):
+        """
+        Drain up to max_jobs cropping jobs: block for the first one, then take what is already queued.
+        
+        Returns:
+            List of (job_ids, urls, ticker, org), empty if the queue stayed empty for `timeout` seconds
+        """
+        jobs = self._pop(self.crop_queue_name, max_jobs, timeout)
+        return [self._articles_job_tuple(job_data) for job_data in jobs]
+
 
-        if job_json:
-            job_data = json.loads(job_json)
-            job_id = job_data['job_id']
-            urls = job_data['data']
-            ticker = job_data["ticker"]
-            org = job_data["org"]
-        return job_id, urls, ticker, org
+# KEYS: the lane's set of streams, a stream;  ARGV: consumer group.  Drops the stream from the set
+# if it holds no entry and none is pending; the stream and its group stay for the next push.
+PRUNE_STREAM_LUA = """
+if redis.call('XLEN', KEYS[2]) == 0 and redis.call('XPENDING', KEYS[2], ARGV[1])[1] == 0 then
+    redis.call('SREM', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+
+class StreamJobQ(RQJobQ):
+    """
+    RQJobQ on Redis Streams with a consumer group, for running several replicas of a service.
+    
+    Lanes and turns work as in RQJobQ, with a stream per user ("<lane>:stream:<key>"). A job read
+    by one consumer stays pending until ack(job_id) - call it once the job is handled and its
+    next-stage job pushed, before taking the next batch: ack covers the latest batch only, jobs
+    of earlier batches left unacked are redelivered. Jobs left pending for `claim_idle_seconds` (a crashed or stuck worker)
+    are claimed by the next consumer reading the lane; after `max_deliveries` attempts a job is
+    moved to "<stream>:dead". Acked jobs are deleted, so a stream holds only the waiting and
+    in-progress jobs. The streams checked for idle jobs are the lane's "<lane>:streams" set: a push
+    adds its stream, the reclaim pass drops the empty ones (the stream and its group are kept).
+    Needs redis >= 6.2.
+    """
+    backend = "stream"
+    
+    def __init__(self, host = 'localhost', port = 6379, dbId = 0, decode_rsp=True,
+                 group: str = "workers", consumer: Optional[str] = None,
+                 claim_idle_seconds: float = 900, max_deliveries: int = 5):
+        super().__init__(host, port, dbId, decode_rsp)
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.claim_idle_ms = int(claim_idle_seconds * 1000)
+        self.max_deliveries = max_deliveries
+        # job_id -> [(stream, entry id)] of the latest batch, not yet acked
+        self._unacked: Dict[str, List[Tuple[str, str]]] = {}
+        # streams known to have the consumer group; pending entries are checked every tenth of claim_idle
+        self._streams_ready = set()
+        self._next_reclaim = 0.0
+        self._prune_stream = self.RQ.register_script(PRUNE_STREAM_LUA)
+    
+    def _user_queue(self, lane: str, share_key: str) -> str:
+        return f"{lane}:stream:{share_key}"
+    
+    def _push_keys(self, lane: str, share_key: str) -> List[str]:
+        # the push (re-)adds the stream to the lane's streams, for reclaiming
+        return super()._push_keys(lane, share_key) + [f"{lane}:streams"]
     
+    def _push(self, queue_name: str, job_data: dict):
+        lane = self._lane(queue_name, job_data['job_id'])
+        stream = self._user_queue(lane, fair_share_key(job_data['job_id']))
+        if stream not in self._streams_ready:
+            try:
+                self.RQ.xgroup_create(stream, self.group, id="0", mkstream=True)
+            except redis.exceptions.ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+            self._streams_ready.add(stream)
+        super()._push(queue_name, job_data)
     
+    def _reclaim(self, lanes: List[str], max_jobs: int) -> List[Tuple[str, str, dict]]:
+        """
+        Claim entries other consumers left pending too long, dead-letter the ones retried too often
+        and drop the empty streams from their lane's set, in a fixed number of round trips.
+        
+        Returns:
+            List of (stream, entry id, fields) claimed, at most max_jobs
+        """
+        pipe = self.RQ.pipeline()
+        for lane in lanes:
+            pipe.smembers(f"{lane}:streams")
+        streams = [(lane, stream) for lane, members in zip(lanes, pipe.execute()) for stream in sorted(members)]
+        if not streams:
+            return []
+        
+        pipe = self.RQ.pipeline()
+        for _, stream in streams:
+            pipe.xlen(stream)
+            pipe.xpending_range(stream, self.group, min="-", max="+", count=max_jobs, idle=self.claim_idle_ms)
+        results = pipe.execute()
+        claims, empty = [], []
+        for (lane, stream), length, pending in zip(streams, results[0::2], results[1::2]):
+            if pending and len(claims) < max_jobs:
+                claims.append((stream, pending[:max_jobs - len(claims)]))
+            elif not length and not pending:
+                empty.append((lane, stream))
+        
+        pipe = self.RQ.pipeline()
+        for stream, pending in claims:
+            pipe.xclaim(stream, self.group, self.consumer, min_idle_time=self.claim_idle_ms,
+                        message_ids=[entry["message_id"] for entry in pending])
+        claimed_streams = pipe.execute()
+        
+        entries = []
+        pipe = self.RQ.pipeline()
+        for (stream, pending), claimed in zip(claims, claimed_streams):
+            exhausted = {entry["message_id"] for entry in pending if entry["times_delivered"] >= self.max_deliveries}
+            for entry_id, fields in claimed:
+                if fields is None:
+                    continue  # deleted from the stream in the meantime
+                if entry_id in exhausted:
+                    print(f"Job {fields['job']} failed {self.max_deliveries} times - moved to {stream}:dead")
+                    pipe.xadd(f"{stream}:dead", fields)
+                    pipe.xack(stream, self.group, entry_id)
+                    pipe.xdel(stream, entry_id)
+                    continue
+                entries.append((stream, entry_id, fields))
+        for lane, stream in empty:
+            # re-checked in the script: a job may have been pushed since
+            self._prune_stream(keys=[f"{lane}:streams", stream], args=[self.group], client=pipe)
+        pipe.execute()
+        return entries
+    
+    def _take(self, lanes: List[str], max_jobs: int) -> List[str]:
+        """Reclaimed jobs of dead consumers first, then new jobs, lanes in priority order, users in turn."""
+        # a new batch: what the last one left unacked stays pending in its stream and is claimed
+        # again once idle for claim_idle_seconds, so it need not be remembered here
+        self._unacked = {}
+        entries = []
+        if time.time() >= self._next_reclaim:
+            self._next_reclaim = time.time() + self.claim_idle_ms / 10000
+            entries = self._reclaim(lanes, max_jobs)
+        
+        if len(entries) < max_jobs:
+            # each turn is the next entry of the key's stream, read here in one round trip
+            turns = [self._user_queue(lane, share_key)
+                     for lane, share_key in self._fair_turns(lanes, max_jobs - len(entries))]
+            counts = Counter(turns)
+            pipe = self.RQ.pipeline()
+            for stream, count in counts.items():
+                pipe.xreadgroup(self.group, self.consumer, {stream: ">"}, count=count)
+            read = {stream: deque(stream_entries) for response in pipe.execute()
+                    for stream, stream_entries in (response or [])}
+            # keep the order of the turns
+            for stream in turns:
+                if read.get(stream):
+                    entry_id, fields = read[stream].popleft()
+                    entries.append((stream, entry_id, fields))
+        
+        jobs_json = []
+        for stream, entry_id, fields in entries:
+            job_data = json.loads(fields["job"])
+            self._unacked.setdefault(job_data["job_id"], []).append((stream, entry_id))
+            jobs_json.append(fields["job"])
+        return jobs_json
+    
+    def ack(self, job_ids):
+        """
+        Acknowledge handled jobs read by this consumer, removing them from their queues.
+        
+        Args:
+            job_ids: A job ID or a list of them
+        """
+        if isinstance(job_ids, str):
+            job_ids = [job_ids]
+        pipe = self.RQ.pipeline()
+        for job_id in job_ids:
+            for stream, entry_id in self._unacked.pop(job_id, []):
+                pipe.xack(stream, self.group, entry_id)
+                pipe.xdel(stream, entry_id)
+        pipe.execute()
+
+
+def default_job_queue() -> RQJobQ:
+    """Job queue from job_queue in config/conf.py: StreamJobQ for backend "stream", else RQJobQ."""
+    settings = dict(configure.job_queue)
+    if settings.pop("backend") == "stream":
+        return StreamJobQ(**settings)
+    return RQJobQ()
+
+    
+# Single-flight: the first job for a (ticker, freshness window) leads, later jobs attach to it.
+# KEYS: flight key, followers list, job -> flight key;  ARGV: job_id, lease seconds
+ATTACH_FLIGHT_LUA = """
+local leader = redis.call('GET', KEYS[1])
+if leader then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    return leader
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SET', KEYS[3], KEYS[1], 'EX', ARGV[2])
+return false
+"""
+
+# KEYS: job -> flight key, flight key, followers list (resolved by the client, JobRegisterMg._flight_keys);
+# ARGV: job_id, lease seconds.  Renews the lease of the flight the job leads.
+RENEW_FLIGHT_LUA = """
+if (redis.call('GET', KEYS[1]) ~= KEYS[2]) or (redis.call('GET', KEYS[2]) ~= ARGV[1]) then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+return 1
+"""
+
+# KEYS: job -> flight key, flight key, followers list;  ARGV: leader job_id.
+# Returns the followers and releases the flight.
+COMPLETE_FLIGHT_LUA = """
+local flight = redis.call('GET', KEYS[1])
+redis.call('DEL', KEYS[1])
+if (flight ~= KEYS[2]) or (redis.call('GET', KEYS[2]) ~= ARGV[1]) then
+    return {}
+end
+local followers = redis.call('LRANGE', KEYS[3], 0, -1)
+redis.call('DEL', KEYS[2], KEYS[3])
+return followers
+"""
+
+# KEYS: history list, latest hash, set of job indexes, job indexes (global, per user / ticker);
+# ARGV: record json, status, time, terminal flag, crops-ready flag, events channel, ttl, epoch, job_id.
+# Appends the history entry and updates the latest status in one step; a terminal status stays the
+# latest one (only "news crops ready" replaces it). Both keys expire ttl seconds after the last push;
+# the job is registered in its indexes at its first push. Then the record is published.
+PUSH_STATUS_LUA = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+if redis.call('HGET', KEYS[2], 'terminal') ~= '1' or ARGV[5] == '1' then
+    redis.call('HSET', KEYS[2], 'status', ARGV[2], 'time', ARGV[3], 'terminal', ARGV[4])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+for i = 4, #KEYS do
+    redis.call('ZADD', KEYS[i], 'NX', ARGV[8], ARGV[9])
+    redis.call('SADD', KEYS[3], KEYS[i])
+end
+redis.call('PUBLISH', ARGV[6], ARGV[1])
+return 1
+"""
+
+# KEYS: job index, set of job indexes;  ARGV: cutoff epoch. Drops entries created before the cutoff
+# and forgets the index once empty (in one step, so a job registered meanwhile is not lost).
+PRUNE_INDEX_LUA = """
+local removed = redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[1])
+if redis.call('ZCARD', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], KEYS[1])
+end
+return removed
+"""
+
+# Article join: a job's articles travel the stages one message each; the last one done completes the job.
+# Done articles are kept as a set of URLs, so a redelivered message does not count its articles twice.
+# KEYS: job:{id}:articles hash, job:{id}:articles:done set;  ARGV: "expected" or "done", ttl, then the
+# article count ("expected") or the done URLs ("done").
+# Returns 1 exactly once, when every expected article is done (at once for a job without an expected
+# count - one message with all its articles).
+JOIN_ARTICLES_LUA = """
+if ARGV[1] == 'expected' then
+    redis.call('HSET', KEYS[1], 'expected', ARGV[3])
+elseif #ARGV > 2 then
+    redis.call('SADD', KEYS[2], unpack(ARGV, 3))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+local expected = redis.call('HGET', KEYS[1], 'expected')
+local done = redis.call('SCARD', KEYS[2])
+if (expected and done >= tonumber(expected)) or ((not expected) and ARGV[1] == 'done') then
+    return redis.call('HSETNX', KEYS[1], 'joined', 1)
+end
+return 0
+"""
+
+JOB_INDEX_KEY = "jobs:index"
+JOB_INDEXES_KEY = "jobs:indexes"
+
+
+def job_owner(job_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (user_id, ticker) of a job: app jobs are "<user_id>@<session_id>@<ticker>@<uid>",
+    refresh jobs "refresh:<ticker>:<time>". None where unknown (or the user is anonymous).
+    """
+    if is_refresh_job(job_id):
+        return None, job_id[len(REFRESH_JOB_PREFIX):].rsplit(":", 1)[0]
+    parts = job_id.split("@")
+    if len(parts) == 4:
+        return parts[0] or None, parts[2] or None
+    return None, None
+
+
+def job_index_keys(job_id: str) -> List[str]:
+    """Indexes a job is registered in: all jobs, plus its user's and its ticker's jobs."""
+    user_id, ticker = job_owner(job_id)
+    keys = [JOB_INDEX_KEY]
+    if user_id:
+        keys.append(f"jobs:user:{user_id}")
+    if ticker:
+        keys.append(f"jobs:ticker:{ticker}")
+    return keys
+
+# KEYS: job -> flight key, then the flight key and followers list if the job started a flight
+# (JobRegisterMg._flight_keys);  ARGV: job_id, event json, lease seconds.  Publishes the event to the job
+# and, if it leads the flight, to the jobs attached to it, renewing the flight's lease. Returns the number
+# of jobs published to.
+PUBLISH_FLIGHT_LUA = """
+local jobs = {ARGV[1]}
+if KEYS[2] and redis.call('GET', KEYS[1]) == KEYS[2] and redis.call('GET', KEYS[2]) == ARGV[1] then
+    for _, follower in ipairs(redis.call('LRANGE', KEYS[3], 0, -1)) do
+        table.insert(jobs, follower)
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    redis.call('EXPIRE', KEYS[3], ARGV[3])
+end
+for _, job in ipairs(jobs) do
+    redis.call('PUBLISH', 'job:' .. job .. ':events', ARGV[2])
+end
+return #jobs
+"""
+
+
+# statuses that end a job: its crops are ready, or a stage gave up on it. Matched at the start only -
+# other statuses embed job ids ("news ready <job_id>", "attached to <job_id>") chosen by users
+TERMINAL_STATUS_PREFIXES = ("news crops ready", "crawl failed", "job failed")
+
+
+def is_terminal_status(status: str) -> bool:
+    """A job is finished once its crops are ready or any stage reported a failure."""
+    return status.lower().startswith(TERMINAL_STATUS_PREFIXES)
+
+
 class JobRegisterMg:
-    def __init__(self, host='localhost', port=6379, dbId=1, decode_rsp=True):
+    def __init__(self, host='localhost', port=6379, dbId=1, decode_rsp=True,
+                 flight_window=None, flight_lease=900, job_ttl=None):
         self.JDB = redis.Redis(
             host=host,
             port=port,
             db=dbId,
             decode_responses=decode_rsp
         )
+        # jobs for the same ticker within one freshness window (by default the ticker's chart TTL,
+        # ChartDB.ttl_for) share a single pipeline run; every status or fragment the leading job
+        # pushes renews the lease, which frees the ticker if the leader dies without a terminal status
+        self.flight_window = flight_window
+        self.flight_lease = flight_lease
+        self._attach_flight = self.JDB.register_script(ATTACH_FLIGHT_LUA)
+        self._renew_flight = self.JDB.register_script(RENEW_FLIGHT_LUA)
+        self._complete_flight = self.JDB.register_script(COMPLETE_FLIGHT_LUA)
+        self._push_status = self.JDB.register_script(PUSH_STATUS_LUA)
+        # status keys of a job expire job_ttl after its last status; older index entries are
+        # pruned by compact_registry
+        self.job_ttl = int(job_ttl or configure.job_registry["job_ttl_seconds"])
+        self._prune_index = self.JDB.register_script(PRUNE_INDEX_LUA)
+        self._join_articles = self.JDB.register_script(JOIN_ARTICLES_LUA)
+        self._publish_flight = self.JDB.register_script(PUBLISH_FLIGHT_LUA)
     
-    def push_status(self, job_id: str, status: str):
-        """Push job status to Redis using lists."""
-        key = f"job:{job_id}:status"  # Redis key pattern
-        
+    def _push_status_record(self, job_id: str, status: str):
         record = {
             "job_id": job_id,
             "status": status,
             "time": dt.utcnow().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        # Push to Redis list (RPUSH for adding to end of list)
-        self.JDB.rpush(key, json.dumps(record))
+        # history entry (job:{id}:status list), latest status (job:{id}:latest hash), registry
+        # entries and the notification on job:{id}:events, written atomically
+        self._push_status(
+            keys=[f"job:{job_id}:status", f"job:{job_id}:latest", JOB_INDEXES_KEY] + job_index_keys(job_id),
+            args=[json.dumps(record), status, record["time"],
+                  int(is_terminal_status(status)), int(status == "news crops ready"),
+                  f"job:{job_id}:events", self.job_ttl, int(time.time()), job_id]
+        )
         print(f"Pushed status for job {job_id}: {status}")
     
+    def push_status(self, job_id: str, status: str):
+        """Push job status to Redis, fanning terminal statuses out to attached jobs."""
+        self._push_status_record(job_id, status)
+        if is_terminal_status(status):
+            for follower_id in self.complete_flight(job_id):
+                self._push_status_record(follower_id, status)
+        else:
+            # the run is alive: keep its flight for another lease
+            keys = self._flight_keys(job_id)
+            if len(keys) == 3:
+                self._renew_flight(keys=keys, args=[job_id, self.flight_lease])
+    
+    def _join(self, job_id: str, field: str, values: List) -> bool:
+        joined = self._join_articles(keys=[f"job:{job_id}:articles", f"job:{job_id}:articles:done"],
+                                     args=[field, self.job_ttl] + values)
+        if joined:
+            self.push_status(job_id, "news crops ready")
+        return bool(joined)
+    
+    def expect_articles(self, job_id: str, count: int) -> bool:
+        """
+        Set how many articles a job waits for, before the first of them is handed to the next stage.
+        
+        Returns:
+            True if the job completed (no articles, or all of them already done)
+        """
+        return self._join(job_id, "expected", [count])
+    
+    def finish_articles(self, job_id: str, urls: List[str]) -> bool:
+        """
+        Mark articles of a job as done (cropped, skipped or failed); pushes "news crops ready"
+        once all expected articles are done. Marking an article twice (a redelivered job) counts it once.
+        
+        Returns:
+            True if this completed the job
+        """
+        return self._join(job_id, "done", list(urls))
+    
+    def publish_fragments(self, job_id: str, fragments: List[Dict]) -> int:
+        """
+        Publish newly saved fragments on job:{job_id}:events (and to the jobs attached to it),
+        for the app to show before the job completes. Not stored: a late subscriber reads them
+        from the fragment DB.
+        
+        Returns:
+            Number of jobs the fragments were published to
+        """
+        event = json.dumps({"job_id": job_id, "fragments": fragments})
+        return self._publish_flight(keys=self._flight_keys(job_id), args=[job_id, event, self.flight_lease])
+    
+    def attach_flight(self, ticker: str, job_id: str) -> Optional[str]:
+        """
+        Join the in-flight pipeline run for a ticker, or start one.
+        
+        Args:
+            ticker: Ticker symbol
+            job_id: Job identifier of the new query
+            
+        Returns:
+            Leader job_id if the job attached to a running one (do not enqueue it),
+            None if this job is the leader (enqueue it as usual)
+        """
+        window = int(time.time() // (self.flight_window or dbs.ChartDB.ttl_for(ticker)))
+        flight_key = f"flight:{ticker}:{window}"
+        leader = self._attach_flight(
+            keys=[flight_key, f"{flight_key}:followers", f"flight:job:{job_id}"],
+            args=[job_id, self.flight_lease]
+        )
+        if leader:
+            self._push_status_record(job_id, f"attached to {leader}")
+        return leader
+    
+    def record_query(self, ticker: str, retention_days: int = 30):
+        """Count a user query for a ticker in today's hit counter (read by hot_tickers)."""
+        key = f"ticker_hits:{dt.utcnow().strftime('%Y%m%d')}"
+        pipe = self.JDB.pipeline()
+        pipe.zincrby(key, 1, ticker)
+        pipe.expire(key, retention_days * 24 * 3600)
+        pipe.execute()
+    
+    def hot_tickers(self, top_k: int = 20, days: int = 7) -> List[Tuple[str, float]]:
+        """
+        Most queried tickers over the last `days` days.
+        
+        Returns:
+            List of (ticker, number of queries), most queried first
+        """
+        today = dt.utcnow()
+        keys = [f"ticker_hits:{(today - timedelta(days=d)).strftime('%Y%m%d')}" for d in range(days)]
+        pipe = self.JDB.pipeline()
+        for key in keys:
+            pipe.zrange(key, 0, -1, withscores=True)
+        counts = dict()
+        for day_counts in pipe.execute():
+            for ticker, count in day_counts:
+                counts[ticker] = counts.get(ticker, 0) + count
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    
+    def _flight_keys(self, job_id: str) -> List[str]:
+        """
+        Keys of the flight a job started: its job -> flight key, then the flight key and its followers
+        list if the job started one. The flight scripts re-check the mapping, as it may have expired since.
+        """
+        job_key = f"flight:job:{job_id}"
+        flight_key = self.JDB.get(job_key)
+        if not flight_key:
+            return [job_key]
+        if isinstance(flight_key, bytes):
+            flight_key = flight_key.decode()
+        return [job_key, flight_key, f"{flight_key}:followers"]
+    
+    def complete_flight(self, job_id: str) -> List[str]:
+        """Release the flight led by job_id and return the job_ids attached to it."""
+        keys = self._flight_keys(job_id)
+        if len(keys) < 3:
+            return []
+        return self._complete_flight(keys=keys, args=[job_id])
+    
     def get_job_status(self, job_id: str) -> str:
         """
         Get the latest status for a job from Redis.
@@ -117,6 +825,13 @@ class JobRegisterMg:
         Returns:
             Latest status message or "nothing" if no records found
         """
+        status = self.JDB.hget(f"job:{job_id}:latest", "status")
+        if status is not None:
+            return status
+        return self._get_legacy_job_status(job_id)
+    
+    def _get_legacy_job_status(self, job_id: str) -> str:
+        """Latest status of a job recorded before the latest-status hash, from its full history."""
         key = f"job:{job_id}:status"
         
         # Get all status records for this job
@@ -134,6 +849,49 @@ class JobRegisterMg:
         
         return latest_record['status']
     
+    def wait_for_job(self, job_id: str, timeout: float = 600,
+                     on_status: Optional[Callable[[str], None]] = None,
+                     on_fragments: Optional[Callable[[List[Dict]], None]] = None) -> str:
+        """
+        Block until a job reaches a terminal status, woken by the statuses published on
+        job:{job_id}:events instead of polling.
+        
+        Args:
+            job_id: Job identifier to wait for
+            timeout: Seconds to wait at most
+            on_status: Called with every non-terminal status seen while waiting
+            on_fragments: Called with the fragments published for the job while waiting
+            
+        Returns:
+            The terminal status, or the latest status if the timeout ran out first
+        """
+        deadline = time.time() + timeout
+        pubsub = self.JDB.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(f"job:{job_id}:events")
+        try:
+            # read after subscribing, so a status pushed in between is not missed
+            status = self.get_job_status(job_id)
+            reported = None
+            while not is_terminal_status(status):
+                if on_status and status != reported:
+                    on_status(status)
+                    reported = status
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                message = pubsub.get_message(timeout=remaining)
+                if message is None:
+                    continue
+                event = json.loads(message["data"])
+                if "fragments" in event:
+                    if on_fragments:
+                        on_fragments(event["fragments"])
+                else:
+                    status = event["status"]
+            return status
+        finally:
+            pubsub.close()
+    
     def get_job_history(self, job_id: str) -> list:
         """Get all status records for a job, sorted by time."""
         key = f"job:{job_id}:status"
@@ -148,18 +906,129 @@ class JobRegisterMg:
         
         return records
     
+    @staticmethod
+    def _index_of(user_id: Optional[str] = None, ticker: Optional[str] = None) -> str:
+        if user_id and ticker:
+            raise ValueError("List jobs by user_id or by ticker, not both")
+        if user_id:
+            return f"jobs:user:{user_id}"
+        if ticker:
+            return f"jobs:ticker:{ticker}"
+        return JOB_INDEX_KEY
+    
+    def list_jobs(self, user_id: Optional[str] = None, ticker: Optional[str] = None,
+                  offset: int = 0, limit: int = 50) -> List[str]:
+        """
+        One page of job IDs, newest first, from the job registry.
+        
+        Args:
+            user_id: Only this user's jobs
+            ticker: Only this ticker's jobs
+            offset: Jobs to skip
+            limit: Page size
+            
+        Returns:
+            Job IDs, created newest first
+        """
+        return self.JDB.zrevrange(self._index_of(user_id, ticker), offset, offset + limit - 1)
+    
+    def count_jobs(self, user_id: Optional[str] = None, ticker: Optional[str] = None) -> int:
+        """Number of jobs listed by list_jobs with the same filter."""
+        return self.JDB.zcard(self._index_of(user_id, ticker))
+    
     def get_all_jobs(self) -> list:
-        """Get list of all job IDs in the database."""
-        # Get all keys that match the job status pattern
-        keys = self.JDB.keys("job:*:status")
-        # Extract job IDs from keys
-        job_ids = [key.split(':')[1] for key in keys]
-        return list(set(job_ids))  # Remove duplicates
+        """Get list of all job IDs in the registry, newest first (page with list_jobs instead)."""
+        return self.JDB.zrevrange(JOB_INDEX_KEY, 0, -1)
     
     def clear_job_history(self, job_id: str) -> int:
         """Clear all status records for a job."""
-        key = f"job:{job_id}:status"
-        return self.JDB.delete(key)
+        pipe = self.JDB.pipeline()
+        pipe.delete(f"job:{job_id}:status", f"job:{job_id}:latest", f"job:{job_id}:articles",
+                    f"job:{job_id}:articles:done")
+        for key in job_index_keys(job_id):
+            pipe.zrem(key, job_id)
+        return pipe.execute()[0]
+    
+    def _adopt_legacy_jobs(self, keys: List[str]) -> Tuple[int, int]:
+        """
+        Status lists written before the registry: expire them job_ttl after the job's creation -
+        the age compact_registry prunes index entries by - and register their jobs, or delete
+        them if that time has passed.
+        
+        Returns:
+            Numbers of jobs adopted and deleted
+        """
+        pipe = self.JDB.pipeline()
+        for key in keys:
+            pipe.ttl(key)
+            pipe.lindex(key, 0)
+        replies = pipe.execute()
+        
+        adopted, deleted = 0, 0
+        now = int(time.time())
+        for key, ttl, first_json in zip(keys, replies[0::2], replies[1::2]):
+            if ttl != -1 or first_json is None:
+                continue  # already expiring, or gone
+            job_id = key[len("job:"):-len(":status")]
+            created = calendar.timegm(dt.strptime(json.loads(first_json)["time"], "%Y-%m-%d %H:%M:%S").timetuple())
+            job_keys = [key, f"job:{job_id}:latest"]
+            if created + self.job_ttl <= now:
+                pipe.delete(*job_keys)
+                deleted += 1
+                continue
+            for job_key in job_keys:
+                pipe.expireat(job_key, created + self.job_ttl)
+            for index in job_index_keys(job_id):
+                pipe.zadd(index, {job_id: created}, nx=True)
+                pipe.sadd(JOB_INDEXES_KEY, index)
+            adopted += 1
+        pipe.execute()
+        return adopted, deleted
+    
+    def compact_registry(self, batch_size: int = 500, pause_seconds: float = 0.01) -> Dict[str, int]:
+        """
+        Prune registry entries of jobs older than job_ttl (their status keys have expired) and
+        adopt status lists written before the registry. Works with SSCAN / SCAN in batches of
+        batch_size and pauses in between, so the queues sharing the Redis server are not held up.
+        
+        Returns:
+            Dictionary with the numbers of "pruned" index entries, "adopted" legacy jobs and
+            "deleted" legacy jobs already older than job_ttl
+        """
+        cutoff = int(time.time()) - self.job_ttl
+        counts = {"pruned": 0, "adopted": 0, "deleted": 0}
+        
+        batch = []
+        for index in self.JDB.sscan_iter(JOB_INDEXES_KEY, count=batch_size):
+            batch.append(index)
+            if len(batch) >= batch_size:
+                counts["pruned"] += self._prune_indexes(batch, cutoff)
+                batch = []
+                time.sleep(pause_seconds)
+        counts["pruned"] += self._prune_indexes(batch, cutoff)
+        
+        batch = []
+        for key in self.JDB.scan_iter(match="job:*:status", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                self._count_adopted(counts, self._adopt_legacy_jobs(batch))
+                batch = []
+                time.sleep(pause_seconds)
+        self._count_adopted(counts, self._adopt_legacy_jobs(batch))
+        print(f"Job registry: pruned {counts['pruned']} entries, adopted {counts['adopted']} legacy jobs, "
+              f"deleted {counts['deleted']} expired ones")
+        return counts
+    
+    @staticmethod
+    def _count_adopted(counts: Dict[str, int], adopted_deleted: Tuple[int, int]):
+        counts["adopted"] += adopted_deleted[0]
+        counts["deleted"] += adopted_deleted[1]
+    
+    def _prune_indexes(self, indexes: List[str], cutoff: int) -> int:
+        pipe = self.JDB.pipeline()
+        for index in indexes:
+            self._prune_index(keys=[index, JOB_INDEXES_KEY], args=[cutoff], client=pipe)
+        return sum(pipe.execute())
     
     
     
@@ -0,0 +1,123 @@
+"""
+Proactive refresh of hot tickers, run as its own service next to the workers:
+    python -m redis_q.refreshScheduler           # a pass every interval_seconds
+    python -m redis_q.refreshScheduler --once    # one pass
+
+Settings from refresh_scheduler in config/conf.py.
+"""
+import argparse
+import time
+from datetime import datetime as dt
+from typing import List, Optional
+
+import config.conf as configure
+import dbutils.db_classes as dbs
+import redis_q.redisUtils as rq
+
+
+class RefreshScheduler:
+    """
+    Re-crawls the most queried tickers shortly before their chart snapshot expires, so their
+    users find warm snapshots, summaries and crops instead of paying for the crawl.
+
+    Query counts come from JobRegisterMg.record_query (called by the app for every query).
+    Refreshes go through RQJobQ.push_refresh_job - the low-priority crawler queue, deduplicated
+    per ticker - at most `max_refreshes_per_hour`, and only inside `off_peak_hours`.
+    """
+    def __init__(self,
+                 chart_db_path: str,
+                 top_k: int = 20,
+                 lookback_days: int = 7,
+                 lead_seconds: float = 2 * 3600,
+                 max_refreshes_per_hour: int = 30,
+                 off_peak_hours: Optional[List[List[int]]] = None,
+                 job_queue: Optional[rq.RQJobQ] = None,
+                 job_register: Optional[rq.JobRegisterMg] = None):
+        self.chart_db = dbs.ChartDB(chart_db_path)
+        self.top_k = top_k
+        self.lookback_days = lookback_days
+        self.lead_seconds = lead_seconds
+        self.max_refreshes_per_hour = max_refreshes_per_hour
+        self.off_peak_hours = off_peak_hours
+        self.job_queue = job_queue or rq.default_job_queue()
+        self.job_register = job_register or rq.JobRegisterMg()
+
+    def in_off_peak(self, now: Optional[dt] = None) -> bool:
+        """True inside one of the [start, end) UTC hour windows (a window may wrap midnight)."""
+        if not self.off_peak_hours:
+            return True
+        hour = (now or dt.utcnow()).hour
+        for start, end in self.off_peak_hours:
+            if (start <= hour < end) if start <= end else (hour >= start or hour < end):
+                return True
+        return False
+
+    def _budget_key(self) -> str:
+        return f"refresh_budget:{dt.utcnow().strftime('%Y%m%d%H')}"
+
+    def budget_left(self) -> int:
+        """Refreshes still allowed this hour."""
+        used = int(self.job_queue.RQ.get(self._budget_key()) or 0)
+        return max(self.max_refreshes_per_hour - used, 0)
+
+    def _spend_budget(self):
+        key = self._budget_key()
+        pipe = self.job_queue.RQ.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, 2 * 3600)
+        pipe.execute()
+
+    def is_due(self, ticker: str) -> bool:
+        """A snapshot is due once it expires within lead_seconds (or has none)."""
+        seconds_left = self.chart_db.seconds_to_expiry(ticker)
+        return seconds_left is None or seconds_left <= self.lead_seconds
+
+    def run_once(self) -> List[str]:
+        """
+        Queue refreshes for the due hot tickers, hottest first, within the hourly budget.
+
+        Returns:
+            Job IDs of the queued refreshes
+        """
+        if not self.in_off_peak():
+            return []
+        budget = self.budget_left()
+        queued = []
+        for ticker, hits in self.job_register.hot_tickers(self.top_k, self.lookback_days):
+            if budget <= 0:
+                print("Refresh budget for this hour used up")
+                break
+            if not self.is_due(ticker):
+                continue
+            job_id = self.job_queue.push_refresh_job(ticker, configure.chart_freshness["refresh_lock_seconds"])
+            # None: a refresh for the ticker is already queued or running
+            if job_id:
+                self._spend_budget()
+                budget -= 1
+                queued.append(job_id)
+                print(f"Refresh queued for {ticker} ({int(hits)} queries)")
+        return queued
+
+
+def default_refresh_scheduler() -> RefreshScheduler:
+    """RefreshScheduler from paths and refresh_scheduler in config/conf.py."""
+    settings = {k: v for k, v in configure.refresh_scheduler.items() if k != "interval_seconds"}
+    return RefreshScheduler(configure.paths["chart_db"], **settings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh hot tickers ahead of their chart expiry")
+    parser.add_argument("--once", action="store_true", help="run a single pass")
+    args = parser.parse_args()
+
+    scheduler = default_refresh_scheduler()
+    while True:
+        queued = scheduler.run_once()
+        print(f"Refresh pass: {len(queued)} refreshes queued")
+        if args.once:
+            break
+        time.sleep(configure.refresh_scheduler["interval_seconds"])
+
+
+if __name__ == "__main__":
+    main()
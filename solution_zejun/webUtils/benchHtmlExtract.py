@@ -0,0 +1,111 @@
+"""
+Benchmark the HTML extraction engines on stored raw pages.
+
+Run from the project root:
+    python -m webUtils.benchHtmlExtract                     # every stored page
+    python -m webUtils.benchHtmlExtract --limit 50 --repeat 3
+    python -m webUtils.benchHtmlExtract data/raw_htmls/AAPL/AAPL_TM_2024-01-01_T_00-00-00_ab12cd34.html blob:<sha256>.html.zst
+
+Pages are the file_path references of the news DB (blob references or plain html files), read
+with read_html, timed with extract_main_text. The other pages in the html store and raw_html_dir
+are chart pages (kept until the retention job collects them), timed with extract_chart_links.
+Every engine is checked against the BeautifulSoup output.
+"""
+import argparse
+import os
+import time
+from typing import Callable, List, Optional, Set
+
+import config.conf as configure
+import dbutils.db_classes as dbs
+import webUtils.htmlExtract as he
+from webUtils.htmlStore import HtmlBlobStore, default_html_store, is_blob_ref, read_html
+
+
+def news_page_refs(news_db_path: str) -> Set[str]:
+    """file_path of every news record with a stored page (blob reference or html file)."""
+    news_db = dbs.NewsManager(news_db_path)
+    records = news_db.fetch_records(news_db.get_all_urls())
+    return {record["file_path"] for record in records.values()
+            if record and record.get("file_path") not in [None, "", "pending"]}
+
+
+def stored_pages(news_refs: Set[str], raw_html_dir: str, store: Optional[HtmlBlobStore]) -> List[str]:
+    """References of the stored pages: the news DB's, then the blobs and html files left (chart pages)."""
+    pages = set(news_refs)
+    if store is not None:
+        pages.update(store.refs())
+    for directory, _, names in os.walk(raw_html_dir):
+        pages.update(os.path.join(directory, name) for name in names if name.endswith(".html"))
+    return sorted(pages, key=lambda page: (page not in news_refs, page))
+
+
+def page_exists(page: str, store: Optional[HtmlBlobStore]) -> bool:
+    if is_blob_ref(page):
+        return store is not None and store.exists(page)
+    return os.path.exists(page)
+
+
+def extractor_of(page: str, news_refs: Set[str]) -> Callable:
+    """extract_main_text for article pages, extract_chart_links for chart pages."""
+    if page in news_refs or "_news_TM_" in os.path.basename(page):
+        return he.extract_main_text
+    return he.extract_chart_links
+
+
+def bench_file(path: str, extract: Callable, store: Optional[HtmlBlobStore] = None, repeat: int = 1) -> dict:
+    """Seconds per engine for one page, plus whether each engine matched bs4."""
+    html = read_html(path, store)
+
+    timings = {}
+    outputs = {}
+    for engine in he.ENGINES:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                outputs[engine] = extract(html, engine)
+            except ValueError as e:
+                outputs[engine] = str(e)
+        timings[engine] = (time.perf_counter() - start) / repeat
+    matches = {engine: outputs[engine] == outputs["bs4"] for engine in he.ENGINES}
+    return {"path": path, "size": len(html), "timings": timings, "matches": matches}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction engines on stored pages")
+    parser.add_argument("paths", nargs="*", help="html files or blob references (default: every stored page)")
+    parser.add_argument("--news-db", default=configure.paths["news_db"])
+    parser.add_argument("--limit", type=int, default=None, help="benchmark at most this many pages")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per page and engine")
+    args = parser.parse_args()
+
+    store = default_html_store()
+    news_refs = news_page_refs(args.news_db)
+    paths = args.paths or stored_pages(news_refs, configure.paths["raw_html_dir"], store)
+    paths = [path for path in paths if page_exists(path, store)][:args.limit]
+    if not paths:
+        print("No HTML pages found")
+        return
+
+    totals = {engine: 0.0 for engine in he.ENGINES}
+    mismatches = {engine: [] for engine in he.ENGINES}
+    total_size = 0
+    for path in paths:
+        result = bench_file(path, extractor_of(path, news_refs), store, args.repeat)
+        total_size += result["size"]
+        for engine in he.ENGINES:
+            totals[engine] += result["timings"][engine]
+            if not result["matches"][engine]:
+                mismatches[engine].append(path)
+
+    print(f"{len(paths)} pages, {total_size / 1e6:.1f} MB")
+    for engine in he.ENGINES:
+        speedup = totals["bs4"] / totals[engine] if totals[engine] else float("inf")
+        print(f"  {engine:<10} {totals[engine]:8.3f}s  {speedup:6.1f}x vs bs4  "
+              f"{len(paths) - len(mismatches[engine])}/{len(paths)} identical")
+        for path in mismatches[engine][:5]:
+            print(f"    differs: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from playwright.async_api import async_playwright
+
+
+class BrowserPool:
+    """
+    Long-lived, size-bounded pool of pages on one persistent Chrome context.
+
+    The persistent context keeps the secured browser profile (cookies, fingerprint), so one
+    context is shared and the pool hands out up to `max_pages` pages at a time. Pages are reused
+    across URLs and jobs, recycled after `max_page_uses` loads or after an error, and the whole
+    context is relaunched on the next request if the browser crashed.
+    """
+    def __init__(self,
+                 user_data_dir: str = "/Users/zejunzheng/chrome_secured",
+                 executable_path: str = "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+                 headless: bool = False,
+                 max_pages: int = 3,
+                 max_page_uses: int = 20):
+        self.user_data_dir = user_data_dir
+        self.executable_path = executable_path
+        self.headless = headless
+        self.max_pages = max_pages
+        self.max_page_uses = max_page_uses
+
+        self._playwright = None
+        self._context = None
+        self._idle_pages: List = []
+        self._page_uses: Dict = {}
+        self._slots = asyncio.Semaphore(max_pages)
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """Launch the browser context if it is not running."""
+        async with self._start_lock:
+            if self._context is not None:
+                return
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._context = await self._playwright.chromium.launch_persistent_context(
+                user_data_dir=self.user_data_dir,
+                headless=self.headless,
+                executable_path=self.executable_path
+            )
+            self._context.on("close", lambda _: self._on_context_closed())
+            # the persistent context opens with a blank page - reuse it
+            self._idle_pages = list(self._context.pages)
+            self._page_uses = {page: 0 for page in self._idle_pages}
+            print(f"Browser pool started (max pages: {self.max_pages})")
+
+    def _on_context_closed(self):
+        """Browser crashed or was closed: drop every page, relaunch on next use."""
+        self._context = None
+        self._idle_pages = []
+        self._page_uses = {}
+
+    async def _close_page(self, page):
+        self._page_uses.pop(page, None)
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception as e:
+            print(f"Error closing page: {e}")
+
+    async def _acquire_page(self):
+        await self._slots.acquire()
+        try:
+            await self.start()
+            while self._idle_pages:
+                page = self._idle_pages.pop()
+                if not page.is_closed():
+                    return page
+                self._page_uses.pop(page, None)
+            page = await self._context.new_page()
+            self._page_uses[page] = 0
+            return page
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def _release_page(self, page, broken: bool = False):
+        try:
+            uses = self._page_uses.get(page, 0) + 1
+            if broken or page.is_closed() or uses >= self.max_page_uses or self._context is None:
+                await self._close_page(page)
+            else:
+                self._page_uses[page] = uses
+                self._idle_pages.append(page)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrow a page from the pool; it is recycled if the body raises."""
+        page = await self._acquire_page()
+        broken = False
+        try:
+            yield page
+        except Exception:
+            broken = True
+            raise
+        finally:
+            await self._release_page(page, broken)
+
+    async def fetch(self, url: str, timeout: int = 150000) -> str:
+        """Load a URL on a pooled page and return the rendered HTML."""
+        async with self.page() as page:
+            await page.goto(url, timeout=timeout)
+            return await page.content()
+
+    async def close(self):
+        """Close every page, the browser context and playwright."""
+        async with self._start_lock:
+            for page in list(self._page_uses):
+                await self._close_page(page)
+            self._idle_pages = []
+            if self._context is not None:
+                context, self._context = self._context, None
+                try:
+                    await context.close()
+                except Exception as e:
+                    print(f"Error closing browser context: {e}")
+            if self._playwright is not None:
+                await self._playwright.stop()
+                self._playwright = None
+        print("Browser pool closed")
@@ -0,0 +1,86 @@
+import asyncio
+import heapq
+import random
+import time
+import urllib.parse
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class HostPacer:
+    """
+    Paces the requests to one host: at most `capacity` fetches in flight, and each slot is
+    free again `interval` seconds plus a random jitter after its fetch *finished*, so a slow
+    page holds the host up instead of letting the next requests pile on.
+    """
+    def __init__(self, interval: float, capacity: int = 1, jitter: Tuple[float, float] = (2.0, 4.9)):
+        self.interval = interval
+        self.capacity = capacity
+        self.jitter = jitter
+        self._slots = asyncio.Semaphore(capacity)
+        # when each free slot may be used again (monotonic seconds), earliest first
+        self._ready_at = [0.0] * capacity
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the host's slots for a whole fetch (without blocking the event loop)."""
+        async with self._slots:
+            ready_at = heapq.heappop(self._ready_at)
+            try:
+                wait = ready_at - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                yield
+            finally:
+                # the pause starts once the fetch is done, whatever its outcome
+                heapq.heappush(self._ready_at, time.monotonic() + self.interval + random.uniform(*self.jitter))
+
+
+class DownloadScheduler:
+    """
+    Runs page downloads concurrently: at most `max_concurrency` in flight overall, and at most
+    `host_burst` per host, each host slot pausing host_interval plus jitter after its fetch
+    finished. Different vendors are fetched in parallel while each one still sees the crawler's
+    human-like rhythm; with host_burst=1 the pages of a single vendor are fetched strictly one
+    at a time, so what overlaps is the caller's work on each page with the wait for the next.
+    """
+    def __init__(self,
+                 fetch: Callable[[str], Awaitable[str]],
+                 max_concurrency: int = 3,
+                 host_interval: float = 5,
+                 host_burst: int = 1,
+                 jitter: Tuple[float, float] = (2.0, 4.9)):
+        self.fetch = fetch
+        self.max_concurrency = max_concurrency
+        self.host_interval = host_interval
+        self.host_burst = host_burst
+        self.jitter = jitter
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._pacers: Dict[str, HostPacer] = {}
+
+    def _pacer(self, url: str) -> HostPacer:
+        host = urllib.parse.urlparse(url).netloc
+        if host not in self._pacers:
+            self._pacers[host] = HostPacer(self.host_interval, self.host_burst, self.jitter)
+        return self._pacers[host]
+
+    async def download(self, url: str) -> str:
+        """Download one URL once its host allows it and a global slot is free."""
+        # wait for the host before taking a global slot, so sleeping hosts don't hold slots;
+        # the host slot is held until the page has loaded
+        async with self._pacer(url).slot():
+            async with self._slots:
+                return await self.fetch(url)
+
+    async def download_all(self, urls: List[str], return_exceptions: bool = False) -> List[Optional[str]]:
+        """
+        Download URLs concurrently.
+
+        Args:
+            urls: URLs to download
+            return_exceptions: If True, a failed download yields its exception instead of raising
+
+        Returns:
+            HTML per URL, in input order
+        """
+        return await asyncio.gather(*[self.download(url) for url in urls], return_exceptions=return_exceptions)
@@ -0,0 +1,167 @@
+"""
+HTML extraction for stored Yahoo pages behind one interface.
+
+Engines, fastest available first: lxml (libxml2), selectolax (lexbor), then BeautifulSoup's
+html.parser as the pure-Python fallback. Every engine returns the same result:
+    extract_main_text(html)   -> text of <main> (lines joined once, in linear time) or None
+    extract_chart_links(html) -> ([{"href", "title"}], org) from a ticker chart page
+"""
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import lxml.html as lxml_html
+except ImportError:
+    lxml_html = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+from bs4 import BeautifulSoup
+
+ORG_CLASS = "name yf-1c9i0iv"
+NEWS_LINK_CLASS = "subtle-link fin-size-small titles noUnderline yf-1btaiiq"
+NEWS_HOST = "sg.finance.yahoo.com/news"
+STORY_BREAK = "Story continues"
+SKIP_TAGS = ("script", "style")
+
+ENGINES = [name for name, module in (("lxml", lxml_html), ("selectolax", SelectolaxParser)) if module is not None]
+ENGINES.append("bs4")
+DEFAULT_ENGINE = ENGINES[0]
+
+
+def join_lines(text_nodes: List[str]) -> str:
+    """
+    Cut the article at "Story continues" and glue short fragments (tickers, "(...)") onto
+    the previous line; everything else starts a new line.
+    """
+    lines = "\n".join(text_nodes).split(STORY_BREAK)[0].split("\n")
+    parts = []
+    for line in lines:
+        parts.append(" " if line.startswith(")") or len(line) < 10 else "\n")
+        parts.append(line)
+    return "".join(parts)
+
+
+def _stripped(texts) -> List[str]:
+    return [text.strip() for text in texts if text and text.strip()]
+
+
+# --- lxml ---------------------------------------------------------------------------------
+
+def _lxml_tree(html: str):
+    # bytes in, so pages with an XML encoding declaration parse as well
+    return lxml_html.document_fromstring(html.encode("utf-8"),
+                                         parser=lxml_html.HTMLParser(encoding="utf-8"))
+
+
+def _lxml_main_text(html: str) -> Optional[List[str]]:
+    main = _lxml_tree(html).find(".//main")
+    if main is None:
+        return None
+    texts = []
+    for node in main.iter():
+        # comments have a non-string tag; scripts/styles are skipped, but not their tails
+        if node is main or (isinstance(node.tag, str) and node.tag not in SKIP_TAGS):
+            texts.append(node.text)
+        if node is not main:
+            texts.append(node.tail)
+    return _stripped(texts)
+
+
+def _lxml_chart_links(html: str) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    tree = _lxml_tree(html)
+    org_divs = tree.xpath("//div[@class=$cls]", cls=ORG_CLASS)
+    org = org_divs[0].get("title") if org_divs else None
+    links = [(a.get("href"), a.get("title")) for a in tree.xpath("//a[@class=$cls]", cls=NEWS_LINK_CLASS)]
+    return links, org
+
+
+# --- selectolax ---------------------------------------------------------------------------
+
+def _selectolax_main_text(html: str) -> Optional[List[str]]:
+    main = SelectolaxParser(html).css_first("main")
+    if main is None:
+        return None
+    for node in main.css(",".join(SKIP_TAGS)):
+        node.decompose()
+    return _stripped(node.text_content for node in main.traverse(include_text=True) if node.tag == "-text")
+
+
+def _selectolax_chart_links(html: str) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    tree = SelectolaxParser(html)
+    org = next((div.attributes.get("title") for div in tree.css("div")
+                if div.attributes.get("class") == ORG_CLASS), None)
+    links = [(a.attributes.get("href"), a.attributes.get("title")) for a in tree.css("a")
+             if a.attributes.get("class") == NEWS_LINK_CLASS]
+    return links, org
+
+
+# --- BeautifulSoup (pure Python) ----------------------------------------------------------
+
+def _bs4_main_text(html: str) -> Optional[List[str]]:
+    main = BeautifulSoup(html, "html.parser").find("main")
+    if not main:
+        return None
+    for tag in main(list(SKIP_TAGS)):
+        tag.decompose()
+    return main.get_text(separator="\n", strip=True).split("\n")
+
+
+def _bs4_chart_links(html: str) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    soup = BeautifulSoup(html, "html.parser")
+    org_div = soup.find("div", class_=ORG_CLASS)
+    org = org_div.get("title") if org_div else None
+    links = [(a.get("href"), a.get("title")) for a in soup.find_all("a", class_=NEWS_LINK_CLASS)]
+    return links, org
+
+
+_MAIN_TEXT = {"lxml": _lxml_main_text, "selectolax": _selectolax_main_text, "bs4": _bs4_main_text}
+_CHART_LINKS = {"lxml": _lxml_chart_links, "selectolax": _selectolax_chart_links, "bs4": _bs4_chart_links}
+
+
+def _check_engine(engine: Optional[str]) -> str:
+    engine = engine or DEFAULT_ENGINE
+    if engine not in ENGINES:
+        raise ValueError(f"HTML engine {engine!r} not available, choose from {ENGINES}")
+    return engine
+
+
+def extract_main_text(html: str, engine: Optional[str] = None) -> Optional[str]:
+    """
+    Article text inside <main>, without scripts/styles, cut at "Story continues".
+
+    Args:
+        html: Raw page HTML
+        engine: "lxml", "selectolax" or "bs4" (default: fastest installed)
+
+    Returns:
+        Article text, None if the page has no <main>
+    """
+    text_nodes = _MAIN_TEXT[_check_engine(engine)](html)
+    if text_nodes is None:
+        return None
+    return join_lines(text_nodes)
+
+
+def extract_chart_links(html: str, engine: Optional[str] = None) -> Tuple[List[Dict[str, str]], str]:
+    """
+    News links and company name from a ticker chart page.
+
+    Args:
+        html: Raw page HTML
+        engine: "lxml", "selectolax" or "bs4" (default: fastest installed)
+
+    Returns:
+        Tuple of (list of {"href", "title"}, org)
+
+    Raises:
+        ValueError: If the page has no company name (layout changed or page blocked)
+    """
+    links, org = _CHART_LINKS[_check_engine(engine)](html)
+    if org is None:
+        raise ValueError("company name not found in chart page")
+    results = [{"href": href, "title": title} for href, title in links
+               if href and title and NEWS_HOST in href]
+    return results, org
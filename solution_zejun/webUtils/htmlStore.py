@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+from typing import IO, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import config.conf as configure
+
+BLOB_PREFIX = "blob:"
+CODEC_EXTENSIONS = {"zstd": ".html.zst", "gzip": ".html.gz"}
+
+
+def is_blob_ref(file_path: Optional[str]) -> bool:
+    """True for a blob reference ("blob:<sha256>.html.zst"), False for a plain file path."""
+    return bool(file_path) and file_path.startswith(BLOB_PREFIX)
+
+
+class HtmlBlobStore:
+    """
+    Content-addressed, compressed store of raw pages.
+
+    A page is stored once under the sha256 of its HTML, so an article linked from several
+    tickers (or downloaded again unchanged) shares one blob. Blobs are zstd- or gzip-compressed
+    and spread over two levels of sub-directories (root/ab/cd/<sha256>.html.zst). Records keep
+    the blob reference "blob:<sha256><ext>", which stays valid if the store root moves.
+    """
+    def __init__(self, root: str, codec: str = "zstd", level: int = 3):
+        if codec not in CODEC_EXTENSIONS:
+            raise ValueError(f"Unknown codec {codec!r}, choose from {list(CODEC_EXTENSIONS)}")
+        if codec == "zstd" and zstandard is None:
+            print("zstandard not installed - html blobs are written with gzip")
+            codec = "gzip"
+        self.root = root
+        self.codec = codec
+        self.level = level
+
+    @staticmethod
+    def _name_of(ref: str) -> str:
+        if not is_blob_ref(ref):
+            raise ValueError(f"Not a blob reference: {ref}")
+        return ref[len(BLOB_PREFIX):]
+
+    def path_of(self, ref: str) -> str:
+        """File path of a blob reference."""
+        name = self._name_of(ref)
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def _find(self, digest: str) -> Optional[str]:
+        """Reference of an existing blob with this hash, whatever its codec."""
+        for extension in CODEC_EXTENSIONS.values():
+            ref = BLOB_PREFIX + digest + extension
+            if os.path.exists(self.path_of(ref)):
+                return ref
+        return None
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return gzip.compress(data, compresslevel=self.level)
+
+    def put(self, html: str) -> str:
+        """
+        Store a page unless an identical one is already stored.
+
+        Args:
+            html: Raw page HTML
+
+        Returns:
+            Blob reference to record as the page's file_path
+        """
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self._find(digest)
+        if existing is not None:
+            try:
+                # a fresh mtime keeps the blob out of reach of the orphan collector's grace period
+                os.utime(self.path_of(existing))
+                return existing
+            except FileNotFoundError:
+                pass  # collected in the meantime - write it again
+
+        ref = BLOB_PREFIX + digest + CODEC_EXTENSIONS[self.codec]
+        path = self.path_of(ref)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so readers and concurrent writers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._compress(data))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return ref
+
+    def open(self, ref: str) -> IO[str]:
+        """Text stream over a blob, decompressed while it is read."""
+        path = self.path_of(ref)
+        if path.endswith(CODEC_EXTENSIONS["zstd"]):
+            if zstandard is None:
+                raise RuntimeError(f"zstandard is required to read {ref}")
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        else:
+            raw = gzip.open(path, "rb")
+        return io.TextIOWrapper(raw, encoding="utf-8")
+
+    def read(self, ref: str) -> str:
+        """Whole page HTML of a blob."""
+        with self.open(ref) as f:
+            return f.read()
+
+    def exists(self, ref: str) -> bool:
+        return os.path.exists(self.path_of(ref))
+
+    def refs(self) -> Iterator[str]:
+        """Reference of every stored blob."""
+        for _, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(tuple(CODEC_EXTENSIONS.values())):
+                    yield BLOB_PREFIX + name
+
+
+def default_html_store() -> Optional[HtmlBlobStore]:
+    """Blob store from html_store in config/conf.py, None if disabled."""
+    return HtmlBlobStore(**configure.html_store) if configure.html_store else None
+
+
+def read_html(file_path: str, store: Optional[HtmlBlobStore] = None) -> str:
+    """
+    Page HTML from a news / chart record's file_path: a blob reference or a plain html file.
+
+    Raises:
+        ValueError: For a blob reference without a store
+    """
+    if is_blob_ref(file_path):
+        if store is None:
+            raise ValueError(f"No html store configured to read {file_path}")
+        return store.read(file_path)
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
@@ -1,108 +1,130 @@
 import asyncio
-import random
-import urllib.parse
-from typing import List, Dict, Optional
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+from typing import Callable, List, Dict, Optional
 import os
+import hashlib
 from datetime import datetime as dt
 
 import dbutils.db_classes as dbs
 import redis_q.redisUtils as rq
+import config.conf as configure
+from webUtils.browserPool import BrowserPool
+from webUtils.downloadScheduler import DownloadScheduler
+import webUtils.htmlExtract as html_extract
+from webUtils.htmlStore import HtmlBlobStore, read_html
 
-import time
 
 class TickerCrawler:
-    def __init__(self, raw_html_folder, charDB_path, newsDB_path):
+    def __init__(self, raw_html_folder, charDB_path, newsDB_path, max_pages = 3, max_page_uses = 20, host_burst = 1,
+                 extract_content = False, keep_raw_html = True, html_store: Optional[HtmlBlobStore] = None):
         self.raw_html_folder = raw_html_folder
+        # compressed, content-addressed page store; None keeps plain per-download files
+        self.html_store = html_store
+        # store article text in the news record at crawl time; raw article html then becomes optional
+        self.extract_content = extract_content
+        self.keep_raw_html = keep_raw_html
         self.base_url_chat = "https://sg.finance.yahoo.com/quote/"
         self.down_load_sleep_base = 5
         self.chart_db = dbs.ChartDB(charDB_path)
         self.news_db = dbs.NewsManager(newsDB_path)
         self.job_status = rq.JobRegisterMg()
+        # background refreshes of stale chart snapshots
+        self.job_queue = rq.default_job_queue()
+        # long-lived browser shared by every URL and job of this worker
+        self.browser_pool = BrowserPool(max_pages=max_pages, max_page_uses=max_page_uses)
+        # human-like pacing per vendor: at most host_burst pages of a host load at once, and each
+        # host slot rests down_load_sleep_base + jitter after its page finished loading
+        self.scheduler = DownloadScheduler(self._download_url,
+                                           max_concurrency=max_pages,
+                                           host_interval=self.down_load_sleep_base,
+                                           host_burst=host_burst,
+                                           jitter=(2.0, 4.9))
     
     async def _download_url(self, url):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch_persistent_context(
-                user_data_dir="/Users/zejunzheng/chrome_secured", 
-                headless=False,
-                executable_path="/Applications/Google Chrome.app/Contents/MacOS/Google Chrome"
-            )
-
-            page = await browser.new_page()
-            await page.goto(url, timeout=150000)
-
-            html = await page.content()
-            print(len(html))  
-
-            await browser.close()
-            return html
+        return await self.browser_pool.fetch(url, timeout=150000)
+    
+    async def close(self):
+        """Shut down the browser pool when the worker stops."""
+        await self.browser_pool.close()
+    
+    def _save_html(self, ticker, name_tag, url, html):
+        if self.html_store is not None:
+            # one blob per distinct page, shared by every ticker - the record keeps its reference
+            return self.html_store.put(html)
+        output_path_tk = self.raw_html_folder + "/" + ticker
+        os.makedirs(output_path_tk, exist_ok=True)
+        # concurrent downloads can finish within the same second - the url hash keeps names unique
+        url_tag = hashlib.md5(url.encode("utf-8")).hexdigest()[:8]
+        output_file_name = ticker + name_tag + dt.utcnow().strftime("%Y-%m-%d_T_%H-%M-%S") + "_" + url_tag + ".html"
+        output_file_html = output_path_tk + "/" + output_file_name
+        with open(output_file_html, "w") as fout:
+            fout.write(html)
+        return output_file_html
     
     async def download_main_pages(self, tickers):
-        sleep_time = self.down_load_sleep_base + random.uniform(2.0, 4.9)
-        output_files = []
-        for ticker in tickers:
-            print(f"processing...{ticker}")
-            url = f"{self.base_url_chat}{ticker}/"
-            html = await self._download_url(url)
-
-            output_path_tk = self.raw_html_folder + "/" + ticker
-            os.makedirs(output_path_tk, exist_ok=True)
-            output_file_name = ticker + "_TM_" + dt.utcnow().strftime("%Y-%m-%d_T_%H-%M-%S") + ".html"
-            output_file_html = output_path_tk + "/" + output_file_name
-            output_files.append(output_file_html)
-            with open(output_file_html, "w") as fout:
-                fout.write(html)
-            time.sleep(sleep_time)
+        print(f"processing...{tickers}")
+        urls = [f"{self.base_url_chat}{ticker}/" for ticker in tickers]
+        # each page is saved as soon as it arrives, while the next one waits for the host
+        output_files = await asyncio.gather(*[self._download_and_save(ticker, url) for ticker, url in zip(tickers, urls)])
         print("- Done")
         return output_files
     
  
     def _extract_links_data_from_chart(self, html_content: str) -> List[Dict[str, str]]:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        org = soup.find('div', class_='name yf-1c9i0iv').get('title')
-
-        # Find all <a> elements with the specific classes
-        links = soup.find_all('a', class_='subtle-link fin-size-small titles noUnderline yf-1btaiiq')
-
-        results = []
-        for link in links:
-            href = link.get('href')
-            if "sg.finance.yahoo.com/news" not in href:
-                continue
-            title = link.get('title')
-
-            if href and title:  # Only include if both are present
-                results.append({
-                    'href': href,
-                    'title': title
-                })
-
-        return results, org
+        # single pass with the fastest installed parser (see webUtils/htmlExtract.py)
+        return html_extract.extract_chart_links(html_content)
+    
+    async def _store_article(self, ticker, url, html):
+        """Extract and/or save one article; returns the "file_path" / "content" of its news record."""
+        content = None
+        if self.extract_content:
+            try:
+                # parse off the event loop so the other downloads keep going
+                content = await asyncio.to_thread(html_extract.extract_main_text, html)
+            except Exception as e:
+                print(f" - failed to extract {url}: {e}")
+        
+        file_path = ""
+        # without extracted text the raw html is kept, so the summariser can still parse it
+        if self.keep_raw_html or not content:
+            file_path = self._save_html(ticker, "_news_TM_", url, html)
+        return {"file_path": file_path, "content": content or "pending"}
+    
+    async def _download_and_save(self, ticker, url):
+        html = await self.scheduler.download(url)
+        return self._save_html(ticker, "_TM_", url, html)
+    
+    async def _download_and_store(self, ticker, url):
+        """Download and store one article, None if the download failed."""
+        try:
+            html = await self.scheduler.download(url)
+        except Exception as e:
+            print(f" - failed to download {url}: {e}")
+            return None
+        return await self._store_article(ticker, url, html)
     
     async def _download_stk_news(self, ticker, urls):
-        sleep_time = self.down_load_sleep_base + random.uniform(2.0, 4.9)
-        output_files = []
-        for url in urls:
-            print(f"processing...{ticker}")
-
-            html = await self._download_url(url)
-
-            output_path_tk = self.raw_html_folder + "/" + ticker
-            os.makedirs(output_path_tk, exist_ok=True)
-            output_file_name = ticker + "_news_TM_" + dt.utcnow().strftime("%Y-%m-%d_T_%H-%M-%S") + ".html"
-            output_file_html = output_path_tk + "/" + output_file_name
-            output_files.append(output_file_html)
-            with open(output_file_html, "w") as fout:
-                fout.write(html)
-
-            time.sleep(sleep_time)
+        """
+        Download a ticker's articles; failed downloads come back as None. Fetches are paced by
+        the scheduler, each article is extracted and stored while the next one is fetched.
+        """
+        print(f"processing...{ticker} - {len(urls)} articles")
+        articles = await asyncio.gather(*[self._download_and_store(ticker, url) for url in urls])
         print("- Done")
-        return output_files
+        return articles
+    
+    async def _download_and_record_article(self, ticker, url, title, on_article):
+        """Download, store and record one article, then hand it on (also when the download failed)."""
+        try:
+            html = await self.scheduler.download(url)
+        except Exception as e:
+            print(f" - failed to download {url}: {e}")
+        else:
+            article = await self._store_article(ticker, url, html)
+            self.news_db.push_records_initial([{"url": url, "title": title, **article}])
+        on_article(url)
     
-    async def _dowload_news_and_record(self, file_path, ticker, max_n = 5):
-        with open(file_path, 'r', encoding='utf-8') as file:
-            html_content_news = file.read()
+    async def _dowload_news_and_record(self, file_path, ticker, max_n = 5, on_listed=None, on_article=None):
+        html_content_news = read_html(file_path, self.html_store)
 
         news_data = dict()
         news_set, org = self._extract_links_data_from_chart(html_content_news)
@@ -117,32 +139,128 @@ class TickerCrawler:
         
         to_download_ruls = [x for x, y in url_rcds.items() if (y is None)]
         
-        htmls = await self._download_stk_news(ticker, to_download_ruls)
-        new_htmls = zip(to_download_ruls, htmls)
-        for new_url, html_file in new_htmls:
-            self.news_db.push_record_initial(new_url, news_data[new_url], html_file)
-            print(f" - inserted new html: {new_url}")
+        if on_article is not None:
+            # streaming: recorded articles go on now, the others as soon as each one is recorded
+            on_listed(initial_urls, org)
+            for url in initial_urls:
+                if url_rcds.get(url) is not None:
+                    on_article(url)
+            await asyncio.gather(*[self._download_and_record_article(ticker, url, news_data[url], on_article)
+                                   for url in to_download_ruls])
+            return initial_urls, org
+        
+        articles = await self._download_stk_news(ticker, to_download_ruls)
+        new_articles = [(new_url, article) for new_url, article in zip(to_download_ruls, articles) if article is not None]
+        # record the whole batch in one write
+        self.news_db.push_records_initial([
+            {"url": new_url, "title": news_data[new_url], **article}
+            for new_url, article in new_articles
+        ])
+        print(f" - inserted new articles: {[new_url for new_url, _ in new_articles]}")
         
         return initial_urls, org
     
-    async def find_or_download_news_urls(self, ticker, job_id):
-        print("check the previous chart downloads ...")
-        url_keys, time_created_str, expired, org = self.chart_db.check_latest(ticker)
-        print(url_keys, time_created_str, expired, org)
+    async def _find_or_download_ticker(self, ticker, refresh_since=None, on_listed=None, on_article=None):
+        """
+        Article URLs of a ticker, from a fresh chart snapshot or a new crawl.
+        
+        With on_article, each article is handed on as soon as it is ready: on_listed(urls, org) first,
+        then on_article(url) once per URL.
+        """
+        print(f"check the previous chart downloads ... {ticker}")
+        url_keys, time_created_str, state, org = self.chart_db.check_freshness(ticker)
+        print(url_keys, time_created_str, state, org)
+        if refresh_since is not None:
+            # refresh job: re-crawl, even ahead of expiry, unless a crawl finished since it was queued
+            state = "expired" if time_created_str is None or time_created_str < refresh_since else "fresh"
+        if state == "stale":
+            # stale-while-revalidate: the job goes on with the snapshot, a refresh job re-crawls it
+            print("previous downloads stale ...serving them, refresh queued...")
+            self.job_queue.push_refresh_job(ticker, configure.chart_freshness["refresh_lock_seconds"])
         # download the char page then refind the urls, if the url in the mews DB, then skip, 
         # otherwise download and insert the record
-        if expired: 
+        elif state != "fresh": 
             print("previous downloads expired ...triggering new dowloads...")
             output_files = await self.download_main_pages([ticker])
             if len(output_files) == 0:
                 raise ValueError(" -- Error: no out put file ---- .")
             print("chart page processing done.   dowloading news ...")
             output_file = output_files[0]
-            urls_checked, org = await self._dowload_news_and_record(output_file, ticker, max_n = 5)
+            urls_checked, org = await self._dowload_news_and_record(output_file, ticker, max_n = 5,
+                                                                    on_listed=on_listed, on_article=on_article)
             print("news page processing done.   add records ...")
             self.chart_db.insert_record(ticker, urls_checked, org)
-            url_keys = urls_checked
+            print(f" news are ready for ticker: {ticker}")
+            return urls_checked, org
+        if on_article is not None:
+            on_listed(url_keys, org)
+            for url in url_keys:
+                on_article(url)
         print(f" news are ready for ticker: {ticker}")
+        return url_keys, org
+    
+    async def find_or_download_news_urls(self, ticker, job_id):
+        url_keys, org = await self._find_or_download_ticker(ticker)
         status = f"news ready {job_id}"
         self.job_status.push_status(job_id, status)
-        return True, url_keys, org
\ No newline at end of file
+        return True, url_keys, org
+    
+    def _handoff(self, ticker, job_ids, on_article):
+        """on_listed / on_article callbacks of a ticker's crawl, handing each article on once for all the jobs of the ticker."""
+        listed = dict()
+        
+        def on_listed(urls, org):
+            listed["org"] = org
+            for job_id in job_ids:
+                # set before the first article leaves, so the join cannot complete early
+                self.job_status.expect_articles(job_id, len(urls))
+        
+        def on_ready(url):
+            on_article(job_ids, ticker, listed["org"], url)
+        
+        return on_listed, on_ready
+    
+    async def find_or_download_news_urls_batch(self, jobs, on_article: Optional[Callable] = None):
+        """
+        Crawl a batch of jobs: duplicate tickers are crawled once, different tickers concurrently
+        over the shared browser, and each result is fanned out to every job of that ticker.
+        A refresh job in the batch makes its ticker re-crawl unless it was crawled after the refresh was queued.
+        
+        Args:
+            jobs: List of (job_id, ticker)
+            on_article: Called as on_article(job_ids, ticker, org, url) for each article of a ticker, with
+                the IDs of all its jobs, as soon as it is recorded (or failed to download), while the rest
+                are still downloading; the jobs' article counts are registered first (JobRegisterMg.expect_articles)
+            
+        Returns:
+            Dictionary with job_id as key and (status, url_keys, org) as value
+        """
+        jobs_by_ticker = dict()
+        for job_id, ticker in jobs:
+            jobs_by_ticker.setdefault(ticker, []).append(job_id)
+        tickers = list(jobs_by_ticker.keys())
+        print(f"crawling {len(tickers)} tickers for {len(jobs)} jobs: {tickers}")
+        
+        refresh_since = dict()
+        for ticker, job_ids in jobs_by_ticker.items():
+            refresh_times = [rq.refresh_job_time(job_id) for job_id in job_ids if rq.is_refresh_job(job_id)]
+            if refresh_times:
+                refresh_since[ticker] = dt.utcfromtimestamp(min(refresh_times)).strftime("%Y-%m-%d %H:%M:%S")
+        
+        handoffs = {ticker: self._handoff(ticker, job_ids, on_article) if on_article else (None, None)
+                    for ticker, job_ids in jobs_by_ticker.items()}
+        crawls = await asyncio.gather(*[self._find_or_download_ticker(ticker, refresh_since.get(ticker), *handoffs[ticker])
+                                        for ticker in tickers], return_exceptions=True)
+        
+        results = dict()
+        for ticker, crawl in zip(tickers, crawls):
+            for job_id in jobs_by_ticker[ticker]:
+                if isinstance(crawl, Exception):
+                    print(f"Error crawling {ticker} for job {job_id}: {crawl}")
+                    self.job_status.push_status(job_id, f"crawl failed: {crawl}")
+                    results[job_id] = (False, None, None)
+                    continue
+                url_keys, org = crawl
+                self.job_status.push_status(job_id, f"news ready {job_id}")
+                results[job_id] = (True, url_keys, org)
+        return results